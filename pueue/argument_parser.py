@@ -1,7 +1,9 @@
+import math
 import argparse
 
 from pueue.client.factories import print_command_factory
 from pueue.daemon.signals import signals
+from pueue.daemon.files import COMPRESSIONS
 
 from pueue.client.displaying import (
     execute_status,
@@ -12,8 +14,62 @@ from pueue.client.displaying import (
 from pueue.client.manipulation import (
     execute_add,
     execute_edit,
+    execute_import,
+    execute_wait,
 )
 
+
+def duration(value):
+    """Convert a duration like `30`, `30s`, `30m`, `2h` or `1d` to seconds."""
+    units = {'s': 1, 'm': 60, 'h': 60*60, 'd': 60*60*24}
+    factor = 1
+    if value and value[-1] in units:
+        factor = units[value[-1]]
+        value = value[:-1]
+    try:
+        seconds = float(value) * factor
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid duration: {}'.format(value))
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise argparse.ArgumentTypeError('The duration has to be positive')
+    return seconds
+
+
+def size(value):
+    """Convert a size like `512`, `64K`, `10M` or `1G` to bytes."""
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+    factor = 1
+    if value and value[-1].upper() in units:
+        factor = units[value[-1].upper()]
+        value = value[:-1]
+    try:
+        size = int(float(value) * factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid size: {}'.format(value))
+    if size < 0:
+        raise argparse.ArgumentTypeError('The size has to be positive')
+    return size
+
+
+def amount(value):
+    """Convert an amount of entries like `10` to an integer, which isn't negative."""
+    try:
+        amount = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid amount: {}'.format(value))
+    if amount < 0:
+        raise argparse.ArgumentTypeError('The amount has to be positive')
+    return amount
+
+
+def positive_amount(value):
+    """Convert an amount like `1000` to an integer, which is at least 1."""
+    value = amount(value)
+    if value == 0:
+        raise argparse.ArgumentTypeError('The amount has to be at least 1')
+    return value
+
+
 # Specifying commands
 parser = argparse.ArgumentParser(description='Pueue client/daemon')
 parser.add_argument('--daemon', action='store_true', help='Starts the pueue daemon')
@@ -39,6 +95,39 @@ subparsers = parser.add_subparsers(
 status_subcommand = subparsers.add_parser(
     'status', help='List the daemon state and process queue.'
 )
+status_subcommand.add_argument(
+    '--status', '-s', type=str, nargs='+',
+    choices=['queued', 'stashed', 'running', 'paused', 'stopping', 'killing', 'done', 'failed'],
+    help='Only show entries with one of these statuses.'
+)
+status_subcommand.add_argument(
+    '--failed', '-f', action='store_true',
+    help="Only show failed entries. Shortcut for '--status failed'."
+)
+status_subcommand.add_argument(
+    '--min-key', type=int, dest='min_key',
+    help='Only show entries with this or a higher key.'
+)
+status_subcommand.add_argument(
+    '--max-key', type=int, dest='max_key',
+    help='Only show entries with this or a lower key.'
+)
+status_subcommand.add_argument(
+    '--path', type=str,
+    help='Only show entries whose path starts with this prefix.'
+)
+status_subcommand.add_argument(
+    '--command', type=str,
+    help='Only show entries whose command contains this string.'
+)
+status_subcommand.add_argument(
+    '--limit', '-l', type=amount,
+    help='Show at most this amount of entries.'
+)
+status_subcommand.add_argument(
+    '--offset', type=amount,
+    help='Skip this amount of matching entries.'
+)
 status_subcommand.set_defaults(func=execute_status)
 
 
@@ -74,6 +163,58 @@ custom_shell_subcommand.set_defaults(
 )
 
 
+# Configuration: queue flush interval
+flush_interval_subcommand = config_subparser.add_parser(
+    'flushInterval', help='Set the minimum time between two writes of the queue to disk.')
+flush_interval_subcommand.add_argument(
+    'value', type=float,
+    help="The interval in seconds. With 0 the queue is written once per daemon loop iteration."
+)
+flush_interval_subcommand.set_defaults(
+    func=print_command_factory('config'),
+    option='flushInterval',
+)
+
+
+# Configuration: maximum output size
+max_output_subcommand = config_subparser.add_parser(
+    'maxOutput', help='Set the default maximum size of the stored stdout and stderr of each process.')
+max_output_subcommand.add_argument(
+    'value', type=size,
+    help="The size in bytes, e.g. '64K' or '10M'. The first and last half are kept. '0' for unlimited."
+)
+max_output_subcommand.set_defaults(
+    func=print_command_factory('config'),
+    option='maxOutput',
+)
+
+
+# Configuration: output compression
+compression_subcommand = config_subparser.add_parser(
+    'compression', help='Set the compression of the stored stdout and stderr of finished processes.')
+compression_subcommand.add_argument(
+    'value', type=str, choices=COMPRESSIONS,
+    help="The compression. 'lzma' compresses better, 'zlib' is faster."
+)
+compression_subcommand.set_defaults(
+    func=print_command_factory('config'),
+    option='compression',
+)
+
+
+# Configuration: timeout signal
+timeout_signal_subcommand = config_subparser.add_parser(
+    'timeoutSignal', help='Set the signal, which is sent to processes that exceed their timeout.')
+timeout_signal_subcommand.add_argument(
+    'value', type=str, choices=list(signals.keys()),
+    help="The signal. Processes, which are still running 10 seconds later, are killed with 'sigkill'."
+)
+timeout_signal_subcommand.set_defaults(
+    func=print_command_factory('config'),
+    option='timeoutSignal',
+)
+
+
 # Show
 show_subcommand = subparsers.add_parser(
     'show', help='Shows the output of running processes (Most recent by default)')
@@ -106,10 +247,48 @@ logs_subcommand.set_defaults(func=execute_log)
 # Add
 add_subcommand = subparsers.add_parser(
     'add', help='Add an entry to the queue.')
+add_subcommand.add_argument(
+    '--timeout', '-t', type=duration,
+    help="Kill the process, if it's still running after this time. E.g. '90', '30s', '30m', '2h' or '1d'.")
+add_subcommand.add_argument(
+    '--max-output', type=size, dest='max_output',
+    help="Only keep the first and last half of this many bytes of each output. E.g. '64K' or '10M'. '0' for unlimited.")
+add_subcommand.add_argument(
+    '--discard-output', action='store_true', dest='discard_output',
+    help="Don't store the output of this command at all.")
 add_subcommand.add_argument(
     'command', type=str, nargs='+', help='The command to be added.')
 add_subcommand.set_defaults(func=execute_add)
 
+# Import
+import_subcommand = subparsers.add_parser(
+    'import', help='Add every line of a file as a new entry to the queue.')
+import_subcommand.add_argument(
+    'file', type=argparse.FileType('r'), nargs='?', default='-',
+    help='The file containing one command per line. Defaults to stdin.')
+import_subcommand.add_argument(
+    '--chunk-size', type=positive_amount, default=1000, dest='chunk_size',
+    help='The amount of commands sent to the daemon at once.')
+import_subcommand.set_defaults(func=execute_import)
+
+# Wait
+wait_subcommand = subparsers.add_parser(
+    'wait', help='Wait until all or the specified entries are finished.')
+wait_subcommand.add_argument(
+    'keys', type=int, nargs='*',
+    help='The indices of the entries to wait for. Defaults to all entries.'
+)
+wait_subcommand.add_argument(
+    '--status', '-s', type=str, nargs='+',
+    choices=['queued', 'stashed', 'running', 'paused', 'done', 'failed'],
+    help="The statuses, which count as finished. Defaults to 'done', 'failed' and 'stashed'."
+)
+wait_subcommand.add_argument(
+    '--timeout', '-t', type=float,
+    help='Give up after this amount of seconds.'
+)
+wait_subcommand.set_defaults(func=execute_wait)
+
 # Remove
 remove_subcommand = subparsers.add_parser(
     'remove', help='Remove a specific entry from the queue.')
@@ -147,6 +326,10 @@ send_subcommand.set_defaults(func=print_command_factory('send'))
 # Reset
 reset_subcommand = subparsers.add_parser(
     'reset', help='Kill all running processes, reset queue and rotate logs.')
+reset_subcommand.add_argument(
+    '-w', '--wait', action='store_true',
+    help='Wait until all processes have been killed and the queue has been reset.'
+)
 reset_subcommand.set_defaults(func=print_command_factory('reset'))
 
 
@@ -222,6 +405,10 @@ kill_subcommand.add_argument(
     '-a', '--all', action='store_true',
     help='Send the signal to the spawned process AND the shell process.',
 )
+kill_subcommand.add_argument(
+    '-g', '--grace', type=duration,
+    help="Send 'sigterm' to the whole process group and 'sigkill' if it's still running after this duration, e.g. '30' or '2m'."
+)
 kill_subcommand.add_argument(
     'keys', type=int, nargs='*',
     help="The indices of the processes to be killed. The daemon won't pause."
@@ -1,19 +1,39 @@
 import os
-import pickle
+import configparser
+
+from pueue.daemon.queue import read_snapshot, replay_journal
+from pueue.daemon.sqlite_queue import read_database
 
 
 def get_queue(config_dir):
-    """Get the queue from the queue backup file."""
+    """Get the queue from the queue files of the configured storage backend."""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(config_dir, 'pueue.ini'))
+    if config.get('default', 'storage', fallback='pickle') == 'sqlite':
+        database_path = os.path.join(config_dir, 'queue.sqlite')
+        if os.path.exists(database_path):
+            try:
+                return read_database(database_path)
+            except Exception:
+                print('Queue database seems to be corrupted. Aborting.')
+                return None
+
+        print('There is no queue database. Aborting.')
+        return None
+
     queue_path = os.path.join(config_dir, 'queue')
+    journal_path = os.path.join(config_dir, 'queue.journal')
     if os.path.exists(queue_path):
-        queue_file = open(queue_path, 'rb')
         try:
-            queue = pickle.load(queue_file)
-            return queue
+            # The daemon might compact the journal while we're reading.
+            # In this case the journal is newer than the snapshot and we need to read both again.
+            while True:
+                generation, queue = read_snapshot(queue_path)
+                if replay_journal(journal_path, generation, queue):
+                    return queue
         except Exception:
             print('Queue log file seems to be corrupted. Aborting.')
             return None
-        queue_file.close()
 
     print('There is no queue log file. Aborting.')
     return None
@@ -0,0 +1,272 @@
+import os
+import pickle
+import socket
+import asyncio
+
+from pueue.client.socket import (
+    HEADER,
+    PROTOCOL_VERSION,
+    get_socket_path,
+    pack_message,
+    receive_data,
+    send_data,
+)
+
+
+class PueueCommands():
+    """Convenience methods for all daemon instructions.
+
+    Every method sends a single instruction via `request` and returns its result.
+    """
+
+    def add(self, command, path=None, timeout=None, max_output=None, discard_output=False):
+        """Add a new command to the queue. Defaults to the current working directory.
+
+        Processes are killed, if they are still running after `timeout` seconds.
+        Only the head and tail of `max_output` bytes of each output are stored.
+        """
+        return self.request('add', {
+            'command': command,
+            'path': path or os.getcwd(),
+            'timeout': timeout,
+            'max_output': max_output,
+            'discard_output': discard_output,
+        })
+
+    def status(self, since_revision=None, session=None, **filters):
+        """Get the daemon status and the current queue.
+
+        If the `session` and revision of an earlier status are given, only changes are sent.
+        `filters` are evaluated by the daemon: statuses, min_key, max_key, path, command,
+        fields, offset and limit.
+        """
+        filters.update({'since_revision': since_revision, 'session': session})
+        return self.request('status', filters)
+
+    def remove(self, keys):
+        """Remove the specified entries from the queue."""
+        return self.request('remove', {'keys': keys})
+
+    def edit(self, key, command):
+        """Edit the command of a `queued` or `stashed` entry."""
+        return self.request('edit', {'key': key, 'command': command})
+
+    def switch(self, first, second):
+        """Switch two entries in the queue."""
+        return self.request('switch', {'first': first, 'second': second})
+
+    def send_input(self, input, key):
+        """Send a string to the stdin of a running process."""
+        return self.request('send', {'input': input, 'key': key})
+
+    def start(self, keys=None):
+        """Start the daemon or the specified entries."""
+        return self.request('start', {'keys': keys})
+
+    def pause(self, keys=None, wait=False):
+        """Pause the daemon or the specified entries."""
+        return self.request('pause', {'keys': keys, 'wait': wait})
+
+    def stash(self, keys):
+        """Stash the specified entries."""
+        return self.request('stash', {'keys': keys})
+
+    def enqueue(self, keys):
+        """Enqueue the specified stashed entries."""
+        return self.request('enqueue', {'keys': keys})
+
+    def restart(self, keys):
+        """Enqueue the specified finished entries again."""
+        return self.request('restart', {'keys': keys})
+
+    def kill(self, keys=None, signal='sigint', all=False, grace=None):
+        """Send a signal to all or the specified processes.
+
+        With a `grace` period `SIGTERM` is sent and processes are killed after `grace` seconds.
+        """
+        return self.request('kill', {'keys': keys, 'signal': signal, 'all': all, 'grace': grace})
+
+    def reset(self, wait=False):
+        """Kill all processes and reset the queue.
+
+        With `wait` the daemon answers once the reset finished.
+        """
+        return self.request('reset', {'wait': wait})
+
+    def clear(self):
+        """Remove all finished entries from the queue."""
+        return self.request('clear')
+
+    def config(self, option, value):
+        """Set a config value of the daemon."""
+        return self.request('config', {'option': option, 'value': value})
+
+    def wait(self, keys=None, statuses=None):
+        """Wait until all or the specified entries are finished.
+
+        The daemon answers once the entries reached one of `statuses`, which defaults to `done`, `failed` and `stashed`.
+        The keys of failed entries are in `response['failed']`.
+        """
+        return self.request('wait', {'keys': keys, 'statuses': statuses})
+
+    def subscribe(self):
+        """Subscribe to the events of the daemon. They are received with `events`.
+
+        The connection should only be used for receiving events afterwards.
+        """
+        return self.request('subscribe')
+
+
+class QueueMirror():
+    """A local copy of the daemon's queue, which is updated with incremental status requests.
+
+    Usage:
+        mirror = QueueMirror()
+        mirror.update(client.status(**mirror.position()))
+    """
+
+    def __init__(self):
+        self.status = None
+        self.entries = {}
+        self.revision = None
+        self.session = None
+
+    def position(self):
+        """Get the arguments for `status` to request all changes since the last update."""
+        return {'since_revision': self.revision, 'session': self.session}
+
+    def update(self, response):
+        """Apply a status response to the mirror."""
+        if response['delta']:
+            self.entries.update(response['data'])
+            for key in response['removed']:
+                self.entries.pop(key, None)
+        elif isinstance(response['data'], dict):
+            self.entries = response['data']
+        else:
+            self.entries = {}
+
+        self.status = response['status']
+        self.revision = response['revision']
+        self.session = response['session']
+
+
+class PueueClient(PueueCommands):
+    """A client, which keeps a single connection to the daemon open.
+
+    Instructions can be pipelined by calling `send` several times before reading
+    the responses with `receive`. The daemon answers in the same order.
+    The convenience methods of `PueueCommands` wait for their response and
+    can only be used if there are no outstanding responses.
+
+    The client can be used as context manager, which closes the connection on exit.
+    """
+
+    def __init__(self, root_dir=None):
+        """Connect to the daemon running in `root_dir`. Defaults to the home directory."""
+        if not root_dir:
+            root_dir = os.path.expanduser('~')
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(get_socket_path(root_dir))
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the connection to the daemon."""
+        self.socket.close()
+
+    def send(self, mode, body=None):
+        """Send an instruction without waiting for its response."""
+        payload = dict(body or {})
+        payload['mode'] = mode
+        send_data(self.socket, payload)
+        self.pending += 1
+
+    def receive(self):
+        """Receive the response to the oldest outstanding instruction."""
+        response = receive_data(self.socket)
+        self.pending -= 1
+        return response
+
+    def request(self, mode, body=None):
+        """Send an instruction and return its response."""
+        if self.pending > 0:
+            raise RuntimeError('There are {} outstanding responses'.format(self.pending))
+        self.send(mode, body)
+        return self.receive()
+
+    def events(self):
+        """Yield all events after `subscribe` has been called."""
+        while True:
+            yield receive_data(self.socket)
+
+
+class AsyncPueueClient(PueueCommands):
+    """The asyncio version of `PueueClient`.
+
+    The connection is opened with `connect`. All convenience methods are coroutines.
+    """
+
+    def __init__(self, root_dir=None):
+        """Create a client for the daemon running in `root_dir`. Defaults to the home directory."""
+        if not root_dir:
+            root_dir = os.path.expanduser('~')
+        self.socket_path = get_socket_path(root_dir)
+        self.reader = None
+        self.writer = None
+        self.pending = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def connect(self):
+        """Connect to the daemon."""
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+
+    async def close(self):
+        """Close the connection to the daemon."""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def send(self, mode, body=None):
+        """Send an instruction without waiting for its response."""
+        payload = dict(body or {})
+        payload['mode'] = mode
+        self.writer.write(pack_message(payload))
+        self.pending += 1
+        await self.writer.drain()
+
+    async def read_message(self):
+        """Read the next message from the daemon."""
+        header = await self.reader.readexactly(HEADER.size)
+        version, length = HEADER.unpack(header)
+        if version != PROTOCOL_VERSION:
+            raise ValueError('Unsupported protocol version {}'.format(version))
+        return pickle.loads(await self.reader.readexactly(length))
+
+    async def receive(self):
+        """Receive the response to the oldest outstanding instruction."""
+        response = await self.read_message()
+        self.pending -= 1
+        return response
+
+    async def request(self, mode, body=None):
+        """Send an instruction and return its response."""
+        if self.pending > 0:
+            raise RuntimeError('There are {} outstanding responses'.format(self.pending))
+        await self.send(mode, body)
+        return await self.receive()
+
+    async def events(self):
+        """Yield all events after `subscribe` has been called."""
+        while True:
+            yield await self.read_message()
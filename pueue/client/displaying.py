@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 import math
 import curses
@@ -10,7 +11,8 @@ from colorclass import Color
 
 from pueue.client import get_queue
 from pueue.client.factories import command_factory
-from pueue.daemon.files import get_descriptor_output
+from pueue.daemon.files import indent, iter_descriptor_output, iter_output
+from pueue.daemon.logger import find_log_entry, iter_log_entry
 
 from terminaltables import AsciiTable
 from terminaltables.terminal_io import terminal_size
@@ -25,11 +27,28 @@ def execute_status(args, root_dir=None):
     `terminaltables` is used to format and display the queue contents.
     `colorclass` is used to color format the various items in the queue.
 
+    The daemon only sends entries, which match the given filters.
+
     Args:
+        args['status'] (list(str)): Only show entries with one of these statuses.
+        args['failed'] (bool): Only show failed entries.
+        args['min_key'] (int): Only show entries with this or a higher key.
+        args['max_key'] (int): Only show entries with this or a lower key.
+        args['path'] (str): Only show entries whose path starts with this prefix.
+        args['command'] (str): Only show entries whose command contains this string.
+        args['offset'] (int): Skip this amount of matching entries.
+        args['limit'] (int): Show at most this amount of entries.
         root_dir (string): The path to the root directory the daemon is running in.
 
     """
-    status = command_factory('status')({}, root_dir=root_dir)
+    statuses = args.get('status')
+    if args.get('failed'):
+        statuses = (statuses or []) + ['failed']
+
+    payload = {'statuses': statuses}
+    for option in ['min_key', 'max_key', 'path', 'command', 'offset', 'limit']:
+        payload[option] = args.get(option)
+    status = command_factory('status')(payload, root_dir=root_dir)
     # First rows, showing daemon status
     if status['status'] == 'running':
         status['status'] = Color('{autogreen}' + '{}'.format(status['status']) + '{/autogreen}')
@@ -42,6 +61,8 @@ def execute_status(args, root_dir=None):
     data = status['data']
     if isinstance(data, str):
         print(data)
+    elif not data:
+        print('No matching entries')
     elif isinstance(data, dict):
         # Format incomming data to be compatible with Terminaltables
         formatted_data = []
@@ -51,7 +72,7 @@ def execute_status(args, root_dir=None):
             formatted_data.append(
                 [
                     '#{}'.format(key),
-                    entry['status'],
+                    'timed out' if entry.get('timed_out') else entry['status'],
                     '{}'.format(entry['returncode']),
                     entry['command'],
                     entry['path'],
@@ -91,7 +112,7 @@ def execute_status(args, root_dir=None):
                         wrapped_string = Color('{autogreen}' + '{}'.format(wrapped_string) + '{/autogreen}')
                     elif wrapped_string in ['queued', 'stashed']:
                         wrapped_string = Color('{autoyellow}' + '{}'.format(wrapped_string) + '{/autoyellow}')
-                    elif wrapped_string in ['failed', 'stopping', 'killing']:
+                    elif wrapped_string in ['failed', 'timed out', 'stopping', 'killing']:
                         wrapped_string = Color('{autored}' + '{}'.format(wrapped_string) + '{/autored}')
                 elif j == 2:
                     if wrapped_string == '0' and wrapped_string != 'Code':
@@ -102,6 +123,9 @@ def execute_status(args, root_dir=None):
                 table.table_data[i][j] = wrapped_string
 
         print(table.table)
+        if status.get('more'):
+            offset = (args.get('offset') or 0) + len(data)
+            print('\nThere are more entries. Use `--offset {}` to see them.'.format(offset))
     print('')
 
 
@@ -140,21 +164,65 @@ def execute_log(args, root_dir):
             entry = queue[key]
             print('Log of entry: {}'.format(key))
             print('Returncode: {}'.format(entry['returncode']))
+            if entry.get('timed_out'):
+                print(Color('{autored}' + 'Timed out after {} seconds'.format(entry['timeout']) + '{/autored}'))
             print('Command: {}'.format(entry['command']))
             print('Path: {}'.format(entry['path']))
-            print('Start: {}, End: {} \n'.format(entry['start'], entry['end']))
-
-            # Write STDERR
-            if len(entry['stderr']) > 0:
-                print(Color('{autored}Stderr output: {/autored}\n    ') + entry['stderr'])
-
-            # Write STDOUT
-            if len(entry['stdout']) > 0:
-                print(Color('{autogreen}Stdout output: {/autogreen}\n    ') + entry['stdout'])
+            print('Start: {}, End: {}'.format(entry['start'], entry['end']))
+            print_output_sizes(entry)
+            print()
+
+            # Write STDERR and STDOUT
+            print_output(entry, 'stderr', key, Color('{autored}Stderr output: {/autored}\n    '))
+            print_output(entry, 'stdout', key, Color('{autogreen}Stdout output: {/autogreen}\n    '))
+        elif key not in queue:
+            print_log_history(root_dir, key)
         else:
             print('No finished process with key {}.'.format(key))
 
 
+def print_log_history(root_dir, key):
+    """Print the log of an entry, which isn't in the current queue, from the log files.
+
+    Entries of previous sessions and removed entries can only be found in the (rotated) logs.
+    """
+    location = find_log_entry(os.path.join(root_dir, '.local/share/pueue'), key)
+    if location is None:
+        print('No finished process with key {}.'.format(key))
+        return
+
+    print('Log of entry {} from {}'.format(key, os.path.basename(location[0])))
+    for piece in iter_log_entry(*location):
+        print(piece, end='')
+    print()
+
+
+def print_output_sizes(entry):
+    """Print the raw and the stored size of compressed outputs."""
+    for name in ['stderr', 'stdout']:
+        output = entry.get(name)
+        if not isinstance(output, dict) or output.get('compression', 'none') == 'none':
+            continue
+        ratio = output['stored_size'] / output['size']
+        print('{}: {} bytes, {} compressed: {} bytes ({:.1%})'.format(
+            name.capitalize(), output['size'], output['compression'], output['stored_size'], ratio))
+
+
+def print_output(entry, name, key, header):
+    """Print the output of a finished entry after a header, if there is any output.
+
+    The output is streamed, as it might be huge.
+    """
+    printed = False
+    for output in iter_output(entry, name, key):
+        if not printed:
+            sys.stdout.write(header)
+            printed = True
+        sys.stdout.write(output)
+    if printed:
+        sys.stdout.write('\n')
+
+
 def execute_show(args, root_dir):
     """Print stderr and stdout of the current running process.
 
@@ -194,8 +262,8 @@ def execute_show(args, root_dir):
     # Get current pueueSTDout file from tmp
     stdoutFile = os.path.join(config_dir, 'pueue_process_{}.stdout'.format(key))
     stderrFile = os.path.join(config_dir, 'pueue_process_{}.stderr'.format(key))
-    stdoutDescriptor = open(stdoutFile, 'r')
-    stderrDescriptor = open(stderrFile, 'r')
+    stdoutDescriptor = open(stdoutFile, 'rb')
+    stderrDescriptor = open(stderrFile, 'rb')
     running = True
 
     # Continually print output with curses or just print once
@@ -213,7 +281,7 @@ def execute_show(args, root_dir):
             while running:
                 stdscr.clear()
                 stdoutDescriptor.seek(0)
-                message = stdoutDescriptor.read()
+                message = stdoutDescriptor.read().decode('utf-8', 'replace')
                 stdscr.addstr(0, 0, message)
                 stdscr.refresh()
                 time.sleep(2)
@@ -226,7 +294,10 @@ def execute_show(args, root_dir):
     else:
         print('Stdout output:\n')
         stdoutDescriptor.seek(0)
-        print(get_descriptor_output(stdoutDescriptor, key))
+        for output in iter_descriptor_output(stdoutDescriptor, key):
+            sys.stdout.write(indent(output))
         print('\n\nStderr output:\n')
         stderrDescriptor.seek(0)
-        print(get_descriptor_output(stderrDescriptor, key))
+        for output in iter_descriptor_output(stderrDescriptor, key):
+            sys.stdout.write(indent(output))
+        print()
@@ -1,6 +1,4 @@
-import pickle
-
-from pueue.client.socket import connect_socket, receive_data, process_response
+from pueue.client.socket import connect_socket, send_data, receive_data, process_response
 
 
 def command_factory(command):
@@ -35,11 +33,11 @@ def command_factory(command):
         # as functions can't be pickled and this shouldn't be send to the daemon.
         if 'func' in body:
             del body['func']
-        data_string = pickle.dumps(body, -1)
-        client.send(data_string)
+        send_data(client, body)
 
         # Receive message, unpickle and return it
         response = receive_data(client)
+        client.close()
         return response
     return communicate
 
@@ -64,10 +62,10 @@ def print_command_factory(command):
         # as functions can't be pickled and this shouldn't be send to the daemon.
         if 'func' in body:
             del body['func']
-        data_string = pickle.dumps(body, -1)
-        client.send(data_string)
+        send_data(client, body)
 
         # Receive message and print it. Exit with 1, if an error has been sent.
         response = receive_data(client)
+        client.close()
         process_response(response)
     return communicate
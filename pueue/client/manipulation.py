@@ -1,16 +1,24 @@
 import os
 import sys
+import socket
 import tempfile
 
 from subprocess import call
+from pueue.client.client import PueueClient
 from pueue.client.factories import command_factory, print_command_factory
 
+# The amount of chunks, which may be sent to the daemon without having been answered.
+MAX_PENDING_CHUNKS = 4
+
 
 def execute_add(args, root_dir=None):
     """Add a new command to the daemon queue.
 
     Args:
         args['command'] (list(str)): The actual programm call. Something like ['ls', '-a'] or ['ls -al']
+        args['timeout'] (float): Kill the process after this amount of seconds.
+        args['max_output'] (int): Only keep the head and tail of this many bytes of the output.
+        args['discard_output'] (bool): Don't store the output.
         root_dir (string): The path to the root directory the daemon is running in.
     """
 
@@ -21,11 +29,100 @@ def execute_add(args, root_dir=None):
     # Send new instruction to daemon
     instruction = {
         'command': command,
-        'path': os.getcwd()
+        'path': os.getcwd(),
+        'timeout': args.get('timeout'),
+        'max_output': args.get('max_output'),
+        'discard_output': args.get('discard_output', False),
     }
     print_command_factory('add')(instruction, root_dir)
 
 
+def execute_import(args, root_dir=None):
+    """Add every line of a file as a new command to the daemon queue.
+
+    The commands are sent in chunks over a single connection. Only a few chunks
+    may be unanswered at once, so huge files are never completely loaded into memory.
+
+    Args:
+        args['file'] (file): The file containing one command per line. Defaults to stdin.
+        args['chunk_size'] (int): The amount of commands sent per instruction.
+        root_dir (string): The path to the root directory the daemon is running in.
+    """
+    if args['chunk_size'] < 1:
+        print('The chunk size has to be at least 1')
+        sys.exit(1)
+
+    try:
+        client = PueueClient(root_dir)
+    except OSError:
+        print('Error connecting to socket. Make sure the daemon is running')
+        sys.exit(1)
+
+    def receive():
+        response = client.receive()
+        if response['status'] != 'success':
+            print(response['message'])
+            sys.exit(1)
+
+    def send(chunk):
+        # Wait for the daemon to process a chunk before sending more
+        if client.pending >= MAX_PENDING_CHUNKS:
+            receive()
+        client.send('add', {'commands': chunk})
+
+    path = os.getcwd()
+    added = 0
+    chunk = []
+    with client:
+        for line in args['file']:
+            command = line.strip()
+            if not command:
+                continue
+            chunk.append({'command': command, 'path': path})
+            if len(chunk) >= args['chunk_size']:
+                send(chunk)
+                added += len(chunk)
+                chunk = []
+        if chunk:
+            send(chunk)
+            added += len(chunk)
+
+        while client.pending > 0:
+            receive()
+    print('Added {} entries'.format(added))
+
+
+def execute_wait(args, root_dir=None):
+    """Block until the specified or all entries are finished.
+
+    The daemon answers as soon as the entries are finished, so no polling is needed.
+    Exits with 1, if any of the entries failed or the timeout is exceeded.
+
+    Args:
+        args['keys'] (list(int)): The keys of the awaited entries. Defaults to all entries.
+        args['status'] (list(str)): The statuses, which count as finished.
+        args['timeout'] (float): The maximum time to wait in seconds.
+        root_dir (string): The path to the root directory the daemon is running in.
+    """
+    try:
+        client = PueueClient(root_dir)
+    except OSError:
+        print('Error connecting to socket. Make sure the daemon is running')
+        sys.exit(1)
+
+    with client:
+        client.socket.settimeout(args['timeout'])
+        try:
+            response = client.wait(args['keys'] or None, args['status'])
+        except socket.timeout:
+            print('Timeout while waiting for entries')
+            sys.exit(1)
+
+    print(response['message'])
+    if response['status'] != 'success' or response['failed']:
+        sys.exit(1)
+
+
 def execute_edit(args, root_dir=None):
     """Edit a existing queue command in the daemon.
 
@@ -37,7 +134,11 @@ def execute_edit(args, root_dir=None):
     EDITOR = os.environ.get('EDITOR', 'vim')
     # Get command from server
     key = args['key']
-    status = command_factory('status')({}, root_dir=root_dir)
+    status = command_factory('status')({
+        'min_key': key,
+        'max_key': key,
+        'fields': ['status', 'command'],
+    }, root_dir=root_dir)
 
     # Check if queue is not empty, the entry exists and is queued or stashed
     if not isinstance(status['data'], str) and key in status['data']:
@@ -2,26 +2,91 @@ import os
 import sys
 import socket
 import pickle
+import struct
+
+# Every message is prefixed by a header containing the protocol version
+# and the length of the pickled payload in bytes.
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('!BQ')
+
+
+def pack_message(payload):
+    """Pickle a payload and prefix it with the message header.
+
+    Args:
+        payload (dict): The payload, which should be sent.
+
+    Returns:
+        bytes: The message including its header.
+    """
+    data = pickle.dumps(payload, -1)
+    return HEADER.pack(PROTOCOL_VERSION, len(data)) + data
+
+
+def unpack_messages(buffer):
+    """Remove all complete messages from a receive buffer and return their payloads.
+
+    Incomplete messages are left in the buffer until the rest has been received.
+
+    Args:
+        buffer (bytearray): The received data. Complete messages are removed from it.
+
+    Returns:
+        list: The unpickled payloads of all complete messages.
+
+    Raises:
+        ValueError: If a message uses a different protocol version.
+    """
+    payloads = []
+    while len(buffer) >= HEADER.size:
+        version, length = HEADER.unpack_from(buffer)
+        if version != PROTOCOL_VERSION:
+            raise ValueError('Unsupported protocol version {}'.format(version))
+        end = HEADER.size + length
+        if len(buffer) < end:
+            break
+        payloads.append(pickle.loads(buffer[HEADER.size:end]))
+        del buffer[:end]
+    return payloads
+
+
+def send_data(socket, payload):
+    """Send a payload to the other side of the socket.
+
+    Args:
+        socket (socket.socket): A connected socket.
+        payload (dict): The payload, which should be sent.
+    """
+    socket.sendall(pack_message(payload))
+
+
+def receive_exactly(socket, length):
+    """Receive exactly `length` bytes from a socket."""
+    data = bytearray()
+    while len(data) < length:
+        packet = socket.recv(min(length - len(data), 1048576))
+        if not packet:
+            raise EOFError('Connection closed while receiving a message')
+        data += packet
+    return data
 
 
 def receive_data(socket):
     """Receive an answer from the daemon and return the response.
 
+    The connection stays open and can be used for further requests.
+
     Args:
     socket (socket.socket): A socket that is connected to the daemon.
 
     Returns:
         dir or string: The unpickled answer.
     """
-    answer = b""
-    while True:
-        packet = socket.recv(4096)
-        if not packet:
-            break
-        answer += packet
-    response = pickle.loads(answer)
-    socket.close()
-    return response
+    header = receive_exactly(socket, HEADER.size)
+    version, length = HEADER.unpack(header)
+    if version != PROTOCOL_VERSION:
+        raise ValueError('Unsupported protocol version {}'.format(version))
+    return pickle.loads(receive_exactly(socket, length))
 
 
 def process_response(response):
@@ -32,6 +97,15 @@ def process_response(response):
         sys.exit(1)
 
 
+def get_socket_path(root_dir):
+    """Get the path of the daemon's socket.
+
+    Args:
+        root_dir (str): The directory that used as root by the daemon.
+    """
+    return os.path.join(root_dir, '.config/pueue', 'pueue.sock')
+
+
 def connect_socket(root_dir):
     """Connect to a daemon's socket.
 
@@ -41,13 +115,10 @@ def connect_socket(root_dir):
     Returns:
         socket.socket: A socket that is connected to the daemon.
     """
-    # Get config directory where the daemon socket is located
-    config_dir = os.path.join(root_dir, '.config/pueue')
-
     # Create Socket and exit with 1, if socket can't be created
     try:
         client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        socket_path = os.path.join(config_dir, 'pueue.sock')
+        socket_path = get_socket_path(root_dir)
         if os.path.exists(socket_path):
             client.connect(socket_path)
         else:
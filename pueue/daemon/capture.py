@@ -0,0 +1,75 @@
+"""Capture of process output with a limited size."""
+import os
+
+
+class OutputCapture():
+    """Write the output of a process to a file, keeping only its head and its tail.
+
+    The process writes into a pipe, which is read by the daemon's event loop.
+    The first half of `max_size` bytes is written to the file right away, so it can be
+    watched with `pueue show`. Afterwards only the last half of `max_size` bytes is kept
+    in a tail buffer, which is written to the file with a truncation marker once the process finished.
+    """
+
+    def __init__(self, pipe, descriptor, max_size):
+        """Create a new capture.
+
+        Args:
+            pipe (file): The read end of the pipe the process writes to.
+            descriptor (file): The binary output file.
+            max_size (int): The maximum amount of bytes that is stored.
+        """
+        self.pipe = pipe
+        self.descriptor = descriptor
+        self.head_size = max_size // 2
+        self.tail_size = max_size - self.head_size
+        self.written = 0
+        self.tail = bytearray()
+        self.dropped = 0
+        os.set_blocking(self.pipe.fileno(), False)
+
+    def fileno(self):
+        """Get the file descriptor of the pipe."""
+        return self.pipe.fileno()
+
+    def read(self):
+        """Read all available output from the pipe. Return `False` once the pipe is closed."""
+        while True:
+            try:
+                data = os.read(self.pipe.fileno(), 65536)
+            except BlockingIOError:
+                return True
+            if not data:
+                return False
+            self.feed(data)
+
+    def feed(self, data):
+        """Store the head of the output and keep the latest bytes in the tail buffer."""
+        if self.written < self.head_size:
+            head = data[:self.head_size - self.written]
+            self.descriptor.write(head)
+            self.written += len(head)
+            data = data[len(head):]
+        if not data:
+            return
+
+        self.tail += data
+        excess = len(self.tail) - self.tail_size
+        if excess > 0:
+            # Deleting from the start of a bytearray doesn't copy the rest.
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def finish(self):
+        """Read the rest of the output, close the pipe and write the tail to the output file.
+
+        The pipe might be kept open by orphaned children of the process.
+        Thereby only the output, which is available right now, is read.
+        """
+        self.read()
+        self.pipe.close()
+        if self.dropped:
+            self.descriptor.write('\n[... {} bytes truncated ...]\n'.format(self.dropped).encode('utf-8'))
+        self.descriptor.write(self.tail)
+        self.descriptor.flush()
+        self.tail = bytearray()
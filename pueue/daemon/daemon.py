@@ -1,20 +1,64 @@
 import os
 import sys
+import math
 import stat
 import signal
 import socket
-import pickle
-import select
+import asyncio
 import configparser
-from copy import deepcopy
+from itertools import islice
 
-from pueue.daemon.files import cleanup
+from pueue.client.socket import pack_message, unpack_messages
+from pueue.daemon.files import COMPRESSIONS, cleanup
+from pueue.daemon.events import EventStream
 
 from pueue.daemon.queue import Queue
+from pueue.daemon.sqlite_queue import SqliteQueue
 from pueue.daemon.logger import Logger
-from pueue.daemon.process_handler import ProcessHandler
+from pueue.daemon.process_handler import ProcessHandler, process_tree
 from pueue.daemon.signals import signals
 
+# Instructions, which would add or spawn entries, aren't executed during a reset.
+BLOCKED_DURING_RESET = ['add', 'restart', 'start']
+
+# All statuses of queue entries
+STATUSES = ['queued', 'stashed', 'running', 'paused', 'stopping', 'killing', 'done', 'failed']
+
+
+def status_filter(payload):
+    """Create a function, which checks whether an entry matches the filters of a status request.
+
+    Returns `None`, if there are no filters.
+    """
+    statuses = payload.get('statuses')
+    min_key = payload.get('min_key')
+    max_key = payload.get('max_key')
+    path = payload.get('path')
+    command = payload.get('command')
+    if statuses is None and min_key is None and max_key is None and path is None and command is None:
+        return None
+
+    def matches(key, entry):
+        return (
+            (statuses is None or entry['status'] in statuses) and
+            (min_key is None or key >= min_key) and
+            (max_key is None or key <= max_key) and
+            (path is None or entry['path'].startswith(path)) and
+            (command is None or command in entry['command'])
+        )
+    return matches
+
+
+def check_options(entry):
+    """Check the options of a new entry and return an error message, if any of them is invalid."""
+    timeout = entry.get('timeout')
+    if timeout is not None and not (isinstance(timeout, (int, float)) and timeout > 0):
+        return 'The timeout has to be a positive number of seconds'
+    max_output = entry.get('max_output')
+    if max_output is not None and not (isinstance(max_output, int) and max_output >= 0):
+        return 'The maximum output size has to be a number of bytes'
+    return None
+
 
 class Daemon():
     """The pueue daemon class.
@@ -35,13 +79,23 @@ class Daemon():
         # In case anything fails, we want to see something in our logs.
         self.read_config()
         self.logger = Logger(root_dir)
+        self.events = EventStream(self.logger, self.remove_client)
 
         try:
             # Get config and initialize Queue, Logger and ProcessHandler
-            self.queue = Queue(self.config_dir)
-            self.process_handler = ProcessHandler(self.queue, self.logger, self.config_dir)
+            if self.config['default'].get('storage', 'pickle') == 'sqlite':
+                self.queue = SqliteQueue(self.config_dir)
+            else:
+                self.queue = Queue(self.config_dir)
+            self.queue.flush_interval = float(self.config['default'].get('flushInterval', 0))
+            self.process_handler = ProcessHandler(self.queue, self.logger, self.config_dir, self.events)
             self.process_handler.set_max(int(self.config['default']['maxProcesses']))
             self.process_handler.set_shell()
+            self.process_handler.max_output = int(self.config['default'].get('maxOutput', 0))
+            self.process_handler.compression = self.config['default'].get('compression', 'zlib')
+            self.logger.compression = self.process_handler.compression
+            timeout_signal = self.config['default'].get('timeoutSignal', 'sigterm')
+            self.process_handler.timeout_signal = signals[timeout_signal.lower()]
 
         except Exception:
             self.logger.exception()
@@ -75,9 +129,19 @@ class Daemon():
         if len(self.queue) > 0 and not self.config['default']['resumeAfterStart']:
             self.paused = True
 
-        # Variables for handling sockets and child process
-        self.process = None
-        self.read_list = [self.socket]
+        # The event loop and its pending callbacks. They are created in `main`.
+        self.loop = None
+        self.stopped = None
+        self.update_handle = None
+        self.update_timer = None
+        # The writers of all connected clients
+        self.clients = set()
+        # Clients, which wait for entries to finish
+        self.waiters = []
+        # Clients, which wait for the reset to finish
+        self.reset_requesters = []
+        # Futures of clients with a deferred answer. They don't send further instructions until answered.
+        self.deferred = {}
 
     def create_socket(self):
         """Create a socket for the daemon, depending on the directory location.
@@ -118,12 +182,137 @@ class Daemon():
         if not os.path.exists(self.config_dir):
             os.makedirs(self.config_dir)
 
-    def respond_client(self, answer, socket):
-        """Send an answer to the client."""
-        response = pickle.dumps(answer, -1)
-        socket.sendall(response)
-        self.read_list.remove(socket)
-        socket.close()
+    def respond_client(self, answer, writer):
+        """Send an answer to the client. The connection stays open for further instructions.
+
+        The answer is buffered by the transport, if the client doesn't receive it right away.
+        """
+        writer.write(pack_message(answer))
+
+    def remove_client(self, writer):
+        """Close the connection to a client and forget about it."""
+        self.events.unsubscribe(writer)
+        self.waiters = [waiter for waiter in self.waiters if waiter['client'] is not writer]
+        if writer in self.reset_requesters:
+            self.reset_requesters.remove(writer)
+        self.resolve_deferred(writer)
+        self.clients.discard(writer)
+        writer.close()
+
+    async def handle_client(self, reader, writer):
+        """Receive the instructions of a client and execute them until the client disconnects.
+
+        Messages are length-prefixed (see `pueue.client.socket`). The received data is
+        collected in a buffer, until a message has been received completely.
+        Each client is served by its own task, so large or slow transfers never block the daemon.
+        """
+        self.clients.add(writer)
+        buffer = bytearray()
+        while writer in self.clients:
+            try:
+                data = await reader.read(1048576)
+            except OSError:
+                self.logger.warning('Client died while sending message, dropping received data.')
+                break
+
+            # The client closed the connection
+            if not data:
+                break
+
+            buffer += data
+            try:
+                payloads = unpack_messages(buffer)
+            except Exception:
+                # Instructions are ignored if they can't be unpickled or use another protocol version
+                self.logger.error('Received invalid message, dropping received data.')
+                break
+
+            for payload in payloads:
+                # Stop, if the client disconnected while we responded to a previous instruction
+                if writer not in self.clients:
+                    break
+                try:
+                    self.execute_instruction(payload, writer)
+                except Exception:
+                    # A broken instruction only fails for the client, which sent it.
+                    self.logger.exception()
+                    self.answer_client({'message': 'Error while executing instruction.',
+                                        'status': 'error'}, writer)
+
+                # Answers are sent in order. Thereby the next instruction
+                # is executed after a deferred answer has been sent.
+                deferred = self.deferred.get(writer)
+                if deferred is not None:
+                    self.schedule_update()
+                    await deferred
+            self.schedule_update()
+
+            # Don't read further instructions, until the client received most of our answers.
+            try:
+                await writer.drain()
+            except ConnectionError:
+                break
+
+        if writer in self.clients:
+            self.remove_client(writer)
+
+    def execute_instruction(self, payload, writer):
+        """Call the respective function for an instruction and send its response to the client."""
+        functions = {
+            'add': self.add,
+            'remove': self.remove,
+            'edit': self.edit_command,
+            'switch': self.switch,
+            'send': self.pipe_to_process,
+            'status': self.send_status,
+            'start': self.start,
+            'pause': self.pause,
+            'stash': self.stash,
+            'enqueue': self.enqueue,
+            'restart': self.restart,
+            'kill': self.kill_process,
+            'reset': lambda payload: self.reset_everything(payload, writer),
+            'clear': self.clear,
+            'config': self.set_config,
+            'STOPDAEMON': self.stop_daemon,
+            'subscribe': lambda payload: self.events.subscribe(writer),
+            'wait': lambda payload: self.wait(payload, writer),
+        }
+
+        if self.reset and payload.get('mode') in BLOCKED_DURING_RESET:
+            response = {'message': 'The queue is being reset. Try again once the reset finished.',
+                        'status': 'error'}
+        elif payload.get('mode') in functions.keys():
+            self.logger.debug('Payload received:')
+            self.logger.debug(payload)
+            response = functions[payload['mode']](payload)
+
+            self.logger.debug('Sending payload:')
+            self.logger.debug(response)
+        else:
+            response = {'message': 'Unknown Command',
+                        'status': 'error'}
+
+        # Waiting clients are answered later
+        if response is None:
+            self.deferred[writer] = self.loop.create_future()
+        else:
+            self.answer_client(response, writer)
+
+    def resolve_deferred(self, writer):
+        """Continue to execute the instructions of a client with a deferred answer."""
+        deferred = self.deferred.pop(writer, None)
+        if deferred is not None and not deferred.done():
+            deferred.set_result(None)
+
+    def answer_client(self, response, writer):
+        """Send the response to an instruction and drop the client, if it disconnected."""
+        self.resolve_deferred(writer)
+        if writer.is_closing():
+            self.logger.warning('Client disconnected during message dispatching. Function successfully executed anyway.')
+            self.remove_client(writer)
+            return
+        self.respond_client(response, writer)
 
     def read_config(self):
         """Read a previous configuration file or create a new with default values."""
@@ -143,6 +332,11 @@ class Daemon():
             'resumeAfterStart': False,
             'maxProcesses': 1,
             'customShell': 'default',
+            'flushInterval': 0,
+            'timeoutSignal': 'sigterm',
+            'maxOutput': 0,
+            'compression': 'zlib',
+            'storage': 'pickle',
         }
         self.config['log'] = {
             'logTime': 60*60*24*14,
@@ -156,126 +350,128 @@ class Daemon():
             self.config.write(file_descriptor)
 
     def main(self):
-        """The main function containing the loop for communication and process management.
+        """Run the event loop of the daemon until it's stopped.
 
         This function is the heart of the daemon.
         It is responsible for:
         - Client communication
         - Executing commands from clients
-        - Update the status of processes by polling the ProcessHandler.
+        - Update the status of processes, whenever a child process exits.
         - Logging
         - Cleanup on exit
 
         """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
         try:
-            while self.running:
-                # Trigger the processing of finished processes by the ProcessHandler.
-                # If there are finished processes we write the log to keep it up to date.
-                if self.process_handler.check_finished():
-                    self.logger.write(self.queue)
-
-                if self.reset and self.process_handler.all_finished():
-                    # Rotate log and reset queue
-                    self.logger.rotate(self.queue)
-                    self.queue.reset()
-                    self.reset = False
-
-                # Check if the ProcessHandler has any free slots to spawn a new process
-                if not self.paused and not self.reset and self.running:
-                    self.process_handler.check_for_new()
-
-                # This is the communication section of the daemon.
-                # 1. Receive message from the client
-                # 2. Check payload and call respective function with payload as parameter.
-                # 3. Execute logic
-                # 4. Return payload with response to client
-
-                # Create list for waitable objects
-                readable, writable, failed = select.select(self.read_list, [], [], 1)
-                for waiting_socket in readable:
-                    if waiting_socket is self.socket:
-                        # Listening for clients to connect.
-                        # Client sockets are added to readlist to be processed.
-                        try:
-                            client_socket, client_address = self.socket.accept()
-                            self.read_list.append(client_socket)
-                        except Exception:
-                            self.logger.warning('Daemon rejected client')
-                    else:
-                        # Trying to receive instruction from client socket
-                        try:
-                            instruction = waiting_socket.recv(1048576)
-                        except (EOFError, OSError):
-                            self.logger.warning('Client died while sending message, dropping received data.')
-                            # Remove client socket
-                            self.read_list.remove(waiting_socket)
-                            waiting_socket.close()
-                            instruction = None
-
-                        # Check for valid instruction
-                        if instruction is not None:
-                            # Check if received data can be unpickled.
-                            try:
-                                payload = pickle.loads(instruction)
-                            except EOFError:
-                                # Instruction is ignored if it can't be unpickled
-                                self.logger.error('Received message is incomplete, dropping received data.')
-                                self.read_list.remove(waiting_socket)
-                                waiting_socket.close()
-                                # Set invalid payload
-                                payload = {'mode': ''}
-
-                            functions = {
-                                'add': self.add,
-                                'remove': self.remove,
-                                'edit': self.edit_command,
-                                'switch': self.switch,
-                                'send': self.pipe_to_process,
-                                'status': self.send_status,
-                                'start': self.start,
-                                'pause': self.pause,
-                                'stash': self.stash,
-                                'enqueue': self.enqueue,
-                                'restart': self.restart,
-                                'kill': self.kill_process,
-                                'reset': self.reset_everything,
-                                'clear': self.clear,
-                                'config': self.set_config,
-                                'STOPDAEMON': self.stop_daemon,
-                            }
-
-                            if payload['mode'] in functions.keys():
-                                self.logger.debug('Payload received:')
-                                self.logger.debug(payload)
-                                response = functions[payload['mode']](payload)
-
-                                self.logger.debug('Sending payload:')
-                                self.logger.debug(response)
-                                try:
-                                    self.respond_client(response, waiting_socket)
-                                except (BrokenPipeError):
-                                    self.logger.warning('Client disconnected during message dispatching. Function successfully executed anyway.')
-                                    # Remove client socket
-                                    self.read_list.remove(waiting_socket)
-                                    waiting_socket.close()
-                                    instruction = None
-                            else:
-                                self.respond_client({'message': 'Unknown Command',
-                                                    'status': 'error'}, waiting_socket)
+            self.loop.run_until_complete(self.serve())
         except Exception:
             self.logger.exception()
 
-        # Wait for killed or stopped processes to finish (cleanup)
+        # Wait for processes, in case the daemon stopped due to an error (cleanup)
         self.process_handler.wait_for_finish()
-        # Close socket, clean everything up and exit
+        self.process_handler.executor.shutdown()
+        self.queue.flush(force=True)
+        # Close sockets, clean everything up and exit
+        self.loop.close()
         self.socket.close()
         cleanup(self.config_dir)
         sys.exit(0)
 
+    async def serve(self):
+        """Serve clients and manage processes until the daemon is stopped.
+
+        Every client is handled by its own task (see `handle_client`).
+        Processes and the queue are managed by `update`, which is scheduled whenever
+        something might have changed: After instructions, once a child process exits
+        (`SIGCHLD`), once the outputs of a finished process are stored
+        and when the next write of the queue is due.
+        """
+        self.stopped = asyncio.Event()
+        self.process_handler.loop = self.loop
+        self.process_handler.wake = self.schedule_update
+        self.loop.add_signal_handler(signal.SIGCHLD, self.schedule_update)
+        server = await asyncio.start_unix_server(self.handle_client, sock=self.socket)
+        self.schedule_update()
+
+        await self.stopped.wait()
+
+        server.close()
+        self.loop.remove_signal_handler(signal.SIGCHLD)
+        # Give the clients a moment to receive their last answers.
+        writers = list(self.clients)
+        for writer in writers:
+            self.remove_client(writer)
+        if writers:
+            await asyncio.wait([asyncio.ensure_future(writer.wait_closed()) for writer in writers], timeout=1)
+        if self.update_timer is not None:
+            self.update_timer.cancel()
+
+    def schedule_update(self):
+        """Run `update` as soon as the current callbacks are done.
+
+        Multiple calls before the next update only lead to a single update.
+        """
+        if self.update_handle is None:
+            self.update_handle = self.loop.call_soon(self.update)
+
+    def update(self):
+        """Check on the processes, start new ones and answer waiting clients."""
+        self.update_handle = None
+        try:
+            # Kill terminated processes, whose grace period is over
+            self.process_handler.check_deadlines()
+
+            # Trigger the processing of finished processes by the ProcessHandler.
+            # The logs of finished processes are appended to the log to keep it up to date.
+            finished = self.process_handler.check_finished()
+            if finished:
+                self.logger.append(self.queue, finished)
+
+            # A reset finishes, once all killed processes exited
+            if self.reset and self.process_handler.all_finished():
+                # Rotate log and reset queue
+                self.logger.rotate(self.queue)
+                self.queue.reset()
+                self.reset = False
+                self.events.publish('reset')
+                for writer in self.reset_requesters:
+                    self.answer_client({'message': 'Queue has been reset', 'status': 'success'}, writer)
+                self.reset_requesters = []
+
+            # Check if the ProcessHandler has any free slots to spawn a new process
+            if not self.paused and not self.reset and self.running:
+                self.process_handler.check_for_new()
+
+            # Answer all waiting clients, whose entries finished during this update.
+            self.check_waiters()
+
+            # Write all changes of this update to disk.
+            self.queue.flush()
+        except Exception:
+            self.logger.exception()
+            self.stopped.set()
+            return
+
+        # The daemon shuts down, once all killed processes exited
+        if not self.running and self.process_handler.all_finished():
+            self.stopped.set()
+            return
+
+        # Update again once the next flush of unwritten changes or the next kill deadline is due.
+        if self.update_timer is not None:
+            self.update_timer.cancel()
+            self.update_timer = None
+        timeouts = [self.queue.flush_timeout(), self.process_handler.deadline_timeout()]
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+        if timeouts:
+            self.update_timer = self.loop.call_later(min(timeouts), self.schedule_update)
+
     def stop_daemon(self, payload=None):
         """Kill current processes and initiate daemon shutdown.
 
-        The daemon will shut down after a last check on all killed processes.
+        The daemon shuts down in `update`, once all killed processes exited.
+        Clients are still served in the meantime.
         """
         kill_signal = signals['9']
         self.process_handler.kill_all(kill_signal, True)
@@ -286,10 +482,29 @@ class Daemon():
 
     def set_config(self, payload):
         """Update the current config depending on the payload and save it."""
+        if payload['option'] == 'timeoutSignal':
+            if str(payload['value']).lower() not in signals:
+                return {'message': 'Unknown signal: {}'.format(payload['value']),
+                        'status': 'error'}
+            self.process_handler.timeout_signal = signals[str(payload['value']).lower()]
+        if payload['option'] == 'maxOutput':
+            if not isinstance(payload['value'], int) or payload['value'] < 0:
+                return {'message': 'The maximum output size has to be a number of bytes',
+                        'status': 'error'}
+            self.process_handler.max_output = payload['value']
+        if payload['option'] == 'compression':
+            if payload['value'] not in COMPRESSIONS:
+                return {'message': 'Unknown compression: {}'.format(payload['value']),
+                        'status': 'error'}
+            self.process_handler.compression = payload['value']
+            self.logger.compression = payload['value']
+
         self.config['default'][payload['option']] = str(payload['value'])
 
         if payload['option'] == 'maxProcesses':
             self.process_handler.set_max(payload['value'])
+        if payload['option'] == 'flushInterval':
+            self.queue.flush_interval = payload['value']
         if payload['option'] == 'customShell':
             path = payload['value']
             if os.path.isfile(path) and os.access(path, os.X_OK):
@@ -309,7 +524,7 @@ class Daemon():
         """Send something to stdin of a specific process."""
         message = payload['input']
         key = payload['key']
-        if not self.process_handler.is_running(key):
+        if key not in self.process_handler.processes:
             return {'message': 'No running process for this key',
                     'status': 'error'}
         self.process_handler.send_to_process(message, key)
@@ -317,39 +532,179 @@ class Daemon():
                 'status': 'success'}
 
     def send_status(self, payload):
-        """Send the daemon status and the current queue for displaying."""
-        answer = {}
-        data = []
+        """Send the daemon status and the current queue for displaying.
+
+        The payload may contain filters, which are evaluated by the daemon:
+        `statuses` (list), a key range (`min_key`, `max_key`), a `path` prefix and a `command` substring.
+        `fields` limits the fields of the sent entries. Matching entries are ordered by key and
+        paginated with `offset` and `limit`. `more` tells whether entries have been cut off.
+
+        If the payload contains the `session` and a `since_revision` of an earlier status,
+        only entries that changed since this revision are sent, as well as a list of `removed` keys.
+        Changed entries, which don't match the filters anymore, are sent as removed.
+        `delta` tells the client whether it got the changes or the whole queue.
+        """
+        for name in ['offset', 'limit']:
+            value = payload.get(name)
+            if value is not None and (not isinstance(value, int) or value < 0):
+                return {'message': 'The {} has to be a positive number'.format(name),
+                        'status': 'error'}
+
+        answer = {
+            'revision': self.queue.revision,
+            'session': self.queue.session,
+            'delta': False,
+        }
         # Get daemon status
         if self.paused:
             answer['status'] = 'paused'
         else:
             answer['status'] = 'running'
 
+        matches = status_filter(payload)
+        fields = payload.get('fields')
+
+        changes = None
+        if payload.get('session') == self.queue.session and payload.get('since_revision') is not None:
+            changes = self.queue.changes_since(payload['since_revision'])
+        if changes is not None:
+            changed, removed = changes
+            answer['delta'] = True
+            answer['data'] = {}
+            for key in changed:
+                entry = self.queue[key]
+                if matches is None or matches(key, entry):
+                    answer['data'][key] = self.status_entry(entry, fields)
+                else:
+                    removed.append(key)
+            answer['removed'] = sorted(removed)
+            return answer
+
         # Add current queue or a message, that queue is empty
-        if len(self.queue) > 0:
-            data = deepcopy(self.queue.queue)
-            # Remove stderr and stdout output for transfer
-            # Some outputs are way to big for the socket buffer
-            # and this is not needed by the client
-            for key, item in data.items():
-                if 'stderr' in item:
-                    del item['stderr']
-                if 'stdout' in item:
-                    del item['stdout']
+        if len(self.queue) == 0:
+            answer['data'] = 'Queue is empty'
+            return answer
+
+        # Status and key range filters are evaluated by the queue
+        entries = self.queue.select(payload.get('statuses'), payload.get('min_key'), payload.get('max_key'))
+        if matches is not None:
+            entries = ((key, entry) for key, entry in entries if matches(key, entry))
+
+        offset = payload.get('offset') or 0
+        limit = payload.get('limit')
+        stop = offset + limit + 1 if limit is not None else None
+        entries = list(islice(entries, offset, stop))
+        answer['more'] = limit is not None and len(entries) > limit
+        if answer['more']:
+            entries.pop()
+
+        answer['data'] = {key: self.status_entry(entry, fields) for key, entry in entries}
+        return answer
+
+    def status_entry(self, entry, fields=None):
+        """Create a projection of an entry with the given fields for the status.
+
+        By default only the displayable fields are sent. Outputs are never copied.
+        """
+        if fields is not None:
+            return {name: entry[name] for name in fields if name in entry}
+        # Spelled out, as this is about twice as fast as a comprehension over the field names.
+        return {
+            'status': entry['status'],
+            'returncode': entry['returncode'],
+            'command': entry['command'],
+            'path': entry['path'],
+            'start': entry['start'],
+            'end': entry['end'],
+            'timed_out': entry.get('timed_out', False),
+        }
+
+    def wait(self, payload, writer):
+        """Answer once the specified entries reached one of the given statuses.
+
+        Without `keys` all entries are awaited, including those that are added while waiting.
+        By default this waits for the `done`, `failed` and `stashed` statuses.
+        Stashed entries won't run, unless they're enqueued. Otherwise waiting for them would block forever.
+        The client isn't answered right away. `check_waiters` answers it once all entries are finished.
+        """
+        keys = payload.get('keys')
+        if keys:
+            missing = [str(key) for key in keys if key not in self.queue]
+            if missing:
+                return {'message': 'No entries for keys: {}'.format(', '.join(missing)), 'status': 'error'}
+
+        waiter = {
+            'client': writer,
+            'keys': set(keys) if keys else None,
+            'statuses': set(payload.get('statuses') or ['done', 'failed', 'stashed']),
+            'revision': self.queue.revision,
+            'remaining': set(),
+            'failed': set(),
+        }
+        if keys:
+            self.update_waiter(waiter, keys, [])
         else:
-            data = 'Queue is empty'
-        answer['data'] = data
+            # Only entries, which are awaited or failed, are loaded via the status index.
+            statuses = [status for status in STATUSES if status not in waiter['statuses'] or status == 'failed']
+            self.update_waiter(waiter, [key for key, _ in self.queue.select(statuses)], [])
+        if not waiter['remaining']:
+            return self.waiter_answer(waiter)
+        self.waiters.append(waiter)
+
+    def update_waiter(self, waiter, changed, removed):
+        """Update the remaining entries of a waiting client with changed and removed keys."""
+        for key in removed:
+            waiter['remaining'].discard(key)
+        for key in changed:
+            if waiter['keys'] is not None and key not in waiter['keys']:
+                continue
+            status = self.queue[key]['status']
+            if status in waiter['statuses']:
+                waiter['remaining'].discard(key)
+                if status == 'failed':
+                    waiter['failed'].add(key)
+            else:
+                waiter['remaining'].add(key)
+
+    def check_waiters(self):
+        """Answer all waiting clients, whose entries are finished.
 
+        Only entries that changed since the last check are looked at.
+        """
+        for waiter in list(self.waiters):
+            changes = self.queue.changes_since(waiter['revision'])
+            if changes is None:
+                # The queue has been reset in the meantime. Check all remaining entries.
+                removed = [key for key in waiter['remaining'] if key not in self.queue]
+                changes = ([key for key in waiter['remaining'] if key in self.queue], removed)
+            waiter['revision'] = self.queue.revision
+            self.update_waiter(waiter, *changes)
+
+            if not waiter['remaining']:
+                self.waiters.remove(waiter)
+                self.answer_client(self.waiter_answer(waiter), waiter['client'])
+
+    def waiter_answer(self, waiter):
+        """Create the answer for a client, whose entries are finished."""
+        answer = {'message': 'All entries finished.', 'status': 'success', 'failed': sorted(waiter['failed'])}
+        if waiter['failed']:
+            answer['message'] += '\nFailed entries: {}'.format(', '.join(str(key) for key in answer['failed']))
         return answer
 
-    def reset_everything(self, payload):
-        """Kill all processes, delete the queue and clean everything up."""
+    def reset_everything(self, payload, writer):
+        """Kill all processes, delete the queue and clean everything up.
+
+        The queue is reset in `update`, once all killed processes exited.
+        If `wait` is set in the payload, the client is answered after the reset finished.
+        """
         kill_signal = signals['9']
         self.process_handler.kill_all(kill_signal, True)
-        self.process_handler.wait_for_finish()
         self.reset = True
 
+        if payload.get('wait'):
+            self.reset_requesters.append(writer)
+            return None
+
         answer = {'message': 'Resetting current queue', 'status': 'success'}
         return answer
 
@@ -360,8 +715,10 @@ class Daemon():
         thoes finished processes.
         """
         self.logger.rotate(self.queue)
-        self.queue.clear()
+        removed = self.queue.clear()
         self.logger.write(self.queue)
+        if removed:
+            self.events.publish('removed', keys=removed)
 
         answer = {'message': 'Finished entries have been removed.', 'status': 'success'}
         return answer
@@ -394,6 +751,7 @@ class Daemon():
             self.process_handler.start_all()
             if self.paused:
                 self.paused = False
+                self.events.publish('daemon_resumed')
                 answer = {'message': 'Daemon and all processes started.',
                           'status': 'success'}
             else:
@@ -427,13 +785,16 @@ class Daemon():
         # Pause all processes and the daemon
         else:
             if payload.get('wait'):
-                self.paused = True
+                if not self.paused:
+                    self.paused = True
+                    self.events.publish('daemon_paused')
                 answer = {'message': 'Pausing daemon, but waiting for processes to finish.',
                           'status': 'success'}
             else:
                 self.process_handler.pause_all()
                 if not self.paused:
                     self.paused = True
+                    self.events.publish('daemon_paused')
                     answer = {'message': 'Daemon and all processes paused.',
                               'status': 'success'}
                 else:
@@ -449,6 +810,7 @@ class Daemon():
         if self.queue[key]:
             if self.queue[key]['status'] in ['queued', 'stashed']:
                 self.queue[key]['command'] = command
+                self.queue.commit(key)
                 answer = {'message': 'Command updated', 'status': 'error'}
             else:
                 answer = {'message': "Entry is not 'queued' or 'stashed'",
@@ -467,6 +829,7 @@ class Daemon():
             if self.queue.get(key) is not None:
                 if self.queue[key]['status'] == 'queued':
                     self.queue[key]['status'] = 'stashed'
+                    self.queue.commit(key)
                     succeeded.append(str(key))
                 else:
                     failed.append(str(key))
@@ -493,6 +856,7 @@ class Daemon():
             if self.queue.get(key) is not None:
                 if self.queue[key]['status'] == 'stashed':
                     self.queue[key]['status'] = 'queued'
+                    self.queue.commit(key)
                     succeeded.append(str(key))
                 else:
                     failed.append(str(key))
@@ -512,15 +876,34 @@ class Daemon():
         return answer
 
     def kill_process(self, payload):
-        """Pause the daemon and kill all processes or kill a specific process."""
-        # Kill specific processes, if `keys` is given in the payload
-        kill_signal = signals[payload['signal'].lower()]
+        """Pause the daemon and kill all processes or kill a specific process.
+
+        If a `grace` period is given, `SIGTERM` is sent to the process groups instead of `signal`.
+        Processes, which are still running after `grace` seconds, are killed with `SIGKILL`.
+        """
+        grace = payload.get('grace')
+        if grace is not None and (not isinstance(grace, (int, float)) or not math.isfinite(grace) or grace <= 0):
+            return {'message': 'The grace period has to be a positive number of seconds',
+                    'status': 'error'}
+        if grace is not None:
+            kill_signal = signal.SIGTERM
+            signal_name = 'sigterm'
+        else:
+            kill_signal = signals[payload['signal'].lower()]
+            signal_name = payload['signal']
         kill_shell = payload.get('all', False)
+        # Kill specific processes, if `keys` is given in the payload
         if payload.get('keys'):
             succeeded = []
             failed = []
+            # The process tree is only needed without `kill_shell`. It's scanned once for all keys.
+            # Terminated processes are signaled via their process group and don't need it.
+            tree = None if kill_shell or grace is not None else process_tree()
             for key in payload.get('keys'):
-                success = self.process_handler.kill_process(key, kill_signal, kill_shell)
+                if grace is not None:
+                    success = self.process_handler.terminate_process(key, grace)
+                else:
+                    success = self.process_handler.kill_process(key, kill_signal, kill_shell, tree)
                 if success:
                     succeeded.append(str(key))
                 else:
@@ -528,7 +911,7 @@ class Daemon():
 
             message = ''
             if len(succeeded) > 0:
-                message += "Signal '{}' sent to processes: {}.".format(payload['signal'], ', '.join(succeeded))
+                message += "Signal '{}' sent to processes: {}.".format(signal_name, ', '.join(succeeded))
                 status = 'success'
             if len(failed) > 0:
                 message += '\nNo running process for keys: {}'.format(', '.join(failed))
@@ -538,19 +921,60 @@ class Daemon():
 
         # Kill all processes and the daemon
         else:
-            self.process_handler.kill_all(kill_signal, kill_shell)
+            if grace is not None:
+                self.process_handler.terminate_all(grace)
+            else:
+                self.process_handler.kill_all(kill_signal, kill_shell)
             if kill_signal == signal.SIGINT or \
                kill_signal == signal.SIGTERM or \
                kill_signal == signal.SIGKILL:
-                self.paused = True
+                if not self.paused:
+                    self.paused = True
+                    self.events.publish('daemon_paused')
             answer = {'message': 'Signal send to all processes.',
                       'status': 'success'}
+
+        if grace is not None and answer['status'] == 'success':
+            answer['message'] += '\nProcesses are killed, if they are still running in {} seconds.'.format(grace)
         return answer
 
     def add(self, payload):
-        """Add a entry to the queue."""
-        self.queue.add_new(payload)
-        return {'message': 'Entry added', 'status': 'success'}
+        """Add a entry to the queue.
+
+        If the payload contains a list of `commands`, all of them are added at once.
+        They are written to disk with the next flush of the queue.
+        """
+        if 'commands' not in payload:
+            error = check_options(payload)
+            if error:
+                return {'message': error, 'status': 'error'}
+            key = self.queue.add_new(payload)
+            self.events.publish('added', keys=[key])
+            return {'message': 'Entry added', 'status': 'success'}
+
+        try:
+            entries = [
+                {
+                    'command': entry['command'],
+                    'path': entry['path'],
+                    'timeout': entry.get('timeout'),
+                    'max_output': entry.get('max_output'),
+                    'discard_output': bool(entry.get('discard_output')),
+                }
+                for entry in payload['commands']
+            ]
+        except (KeyError, TypeError, AttributeError):
+            return {'message': 'Every entry needs a command and a path', 'status': 'error'}
+        for entry in entries:
+            error = check_options(entry)
+            if error:
+                return {'message': error, 'status': 'error'}
+
+        keys = [self.queue.add_new(entry) for entry in entries]
+        if not keys:
+            return {'message': 'No entries added', 'status': 'success'}
+        self.events.publish('added', keys=keys)
+        return {'message': 'Added entries: {}-{}'.format(keys[0], keys[-1]), 'status': 'success'}
 
     def remove(self, payload):
         """Remove specified entries from the queue."""
@@ -569,6 +993,7 @@ class Daemon():
 
         message = ''
         if len(succeeded) > 0:
+            self.events.publish('removed', keys=[int(key) for key in succeeded])
             message += 'Removed entries: {}.'.format(', '.join(succeeded))
             status = 'success'
         if len(failed) > 0:
@@ -610,6 +1035,7 @@ class Daemon():
         for key in payload['keys']:
             restarted = self.queue.restart(key)
             if restarted:
+                self.events.publish('added', keys=[self.queue.next_key - 1])
                 succeeded.append(str(key))
             else:
                 failed.append(str(key))
@@ -0,0 +1,59 @@
+"""Push based event streaming to subscribed clients."""
+from pueue.client.socket import pack_message
+
+# The amount of unsent bytes per subscriber. Slower subscribers are disconnected.
+MAX_PENDING_BYTES = 4 * 1048576
+
+
+class EventStream():
+    """Send events to all subscribed clients.
+
+    A client subscribes by sending a `subscribe` instruction. Afterwards its connection
+    receives one message for every event, e.g. `{'event': 'finished', 'key': 3, ...}`.
+
+    Subscribers are `asyncio.StreamWriter`s. Messages are written to their transport,
+    which sends as much as possible right away and buffers the rest.
+    A subscriber with more than `MAX_PENDING_BYTES` unsent bytes is disconnected,
+    so a slow consumer can't use up the daemon's memory.
+    """
+
+    def __init__(self, logger, disconnect):
+        """Create a new event stream.
+
+        Args:
+            logger (Logger): The daemon logger.
+            disconnect (function): Called with the writer of subscribers, which should be disconnected.
+        """
+        self.logger = logger
+        self.disconnect = disconnect
+        self.subscribers = set()
+
+    def subscribe(self, writer):
+        """Send all future events to this client."""
+        self.subscribers.add(writer)
+        return {'message': 'Subscribed to events', 'status': 'success'}
+
+    def unsubscribe(self, writer):
+        """Stop sending events to this client."""
+        self.subscribers.discard(writer)
+
+    def is_subscribed(self, writer):
+        """Check whether this client receives events."""
+        return writer in self.subscribers
+
+    def publish(self, event, **data):
+        """Send an event to all subscribers."""
+        if not self.subscribers:
+            return
+        data['event'] = event
+        message = pack_message(data)
+        for writer in list(self.subscribers):
+            self.send(writer, message)
+
+    def send(self, writer, message):
+        """Send a message to a subscriber, unless it has too many unsent messages."""
+        if writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            self.logger.warning('Subscriber is too slow. Disconnecting.')
+            self.disconnect(writer)
+            return
+        writer.write(message)
@@ -1,5 +1,16 @@
 """Helper for file handling."""
 import os
+import lzma
+import zlib
+
+# The amount of bytes read from output files at once.
+OUTPUT_CHUNK_SIZE = 1048576
+
+# Lines, which are longer than this, are decoded in pieces.
+MAX_LINE_SIZE = 1048576
+
+# Compressions of stored outputs. `none` stores them as they are.
+COMPRESSIONS = ['none', 'zlib', 'lzma']
 
 
 def cleanup(config_dir):
@@ -16,23 +27,188 @@ def cleanup(config_dir):
         os.remove(socketPath)
 
 
+def write_atomically(path, data):
+    """Write data to a file, such that readers either see the old or the new content.
+
+    The data is written to a temporary file, synced to disk and renamed to the actual path.
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.rename(temp_path, path)
+
+
+def get_output_path(config_dir, key, name):
+    """Get the path of the stored `stdout` or `stderr` output of an entry."""
+    return os.path.join(config_dir, 'output', '{}.{}'.format(key, name))
+
+
+def compress_output(source_path, path, compression):
+    """Store an output file at `path`, compressing it on the way.
+
+    The output is compressed in chunks, so it's never loaded into memory at once.
+    The source file is kept, so it can be read until the stored file is complete.
+    Returns the size of the stored file.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    if compression == 'none':
+        os.link(source_path, path)
+        return os.path.getsize(path)
+
+    if compression == 'zlib':
+        compressor = zlib.compressobj()
+    else:
+        compressor = lzma.LZMACompressor()
+    with open(source_path, 'rb') as source, open(path, 'wb') as target:
+        for chunk in iter(lambda: source.read(OUTPUT_CHUNK_SIZE), b''):
+            target.write(compressor.compress(chunk))
+        target.write(compressor.flush())
+    return os.path.getsize(path)
+
+
+def remove_output(config_dir, key):
+    """Remove the stored outputs of an entry."""
+    for name in ['stdout', 'stderr']:
+        path = get_output_path(config_dir, key, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def read_output(entry, name, key):
+    """Read the `stdout` or `stderr` output of a finished entry.
+
+    The output of finished processes is stored in separate files. The entry only references
+    the file with a dict containing its `path`, its raw `size`, its `compression` and
+    the `stored_size` of the file. Entries of old pueue versions and entries that failed
+    before a process was spawned contain the output as a string instead.
+    """
+    return ''.join(iter_output(entry, name, key))
+
+
+def iter_output(entry, name, key):
+    """Yield the indented `stdout` or `stderr` output of a finished entry in pieces.
+
+    See `read_output`. Nothing is yielded, if there is no output.
+    """
+    output = entry.get(name, '')
+    if isinstance(output, str):
+        if output:
+            yield indent(output)
+        return
+    if output['size'] == 0 or not os.path.exists(output['path']):
+        return
+    with open(output['path'], 'rb') as descriptor:
+        compression = output.get('compression', 'none')
+        if compression == 'zlib':
+            chunks = iter_zlib_chunks(descriptor)
+        else:
+            if compression == 'lzma':
+                descriptor = lzma.LZMAFile(descriptor)
+            chunks = iter(lambda: descriptor.read(OUTPUT_CHUNK_SIZE), b'')
+        for piece in iter_decoded_output(chunks, key):
+            yield indent(piece)
+
+
+def iter_zlib_chunks(descriptor):
+    """Decompress a zlib compressed file in chunks of at most `OUTPUT_CHUNK_SIZE` bytes.
+
+    Repetitive outputs compress extremely well, so even the decompressed
+    data of a single compressed chunk is limited in size.
+    """
+    decompressor = zlib.decompressobj()
+    while True:
+        data = decompressor.unconsumed_tail or descriptor.read(OUTPUT_CHUNK_SIZE)
+        if not data:
+            break
+        chunk = decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+        if chunk:
+            yield chunk
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+
+
+def indent(output):
+    """Indent all lines of an output but the first one for displaying."""
+    return output.replace('\n', '\n    ')
+
+
 def get_descriptor_output(descriptor, key, handler=None):
-    """Get the descriptor output and handle incorrect UTF-8 encoding of subprocess logs.
+    """Get the indented descriptor output. See `iter_descriptor_output`."""
+    return ''.join(indent(piece) for piece in iter_descriptor_output(descriptor, key, handler))
+
+
+def iter_descriptor_output(descriptor, key, handler=None):
+    """Yield the descriptor output in pieces and handle incorrect UTF-8 encoding of subprocess logs.
+
+    See `iter_decoded_output`.
+    """
+    # Text files are read from their underlying binary buffer
+    descriptor = getattr(descriptor, 'buffer', descriptor)
+    return iter_decoded_output(iter(lambda: descriptor.read(OUTPUT_CHUNK_SIZE), b''), key, handler)
+
+
+def iter_decoded_output(chunks, key, handler=None):
+    """Decode binary chunks of output and yield them in pieces.
 
     In case an process contains valid UTF-8 lines as well as invalid lines, we want to preserve
     the valid and remove the invalid ones.
-    To do this we need to get each line and check for an UnicodeDecodeError.
+    The chunks are cut after their last complete line.
+    Output without newlines, e.g. progress bars or binary data, is cut after the last
+    complete character, once it exceeds `MAX_LINE_SIZE`. Thereby it's never buffered in full.
+    Chunks are decoded at once. Only if this fails, their lines are decoded one by one.
     """
-    line = 'stub'
-    lines = ''
-    while line != '':
+    rest = b''
+    for chunk in chunks:
+        chunk = rest + chunk
+        end = chunk.rfind(b'\n') + 1
+        if not end and len(chunk) > MAX_LINE_SIZE:
+            end = character_boundary(chunk)
+        rest = chunk[end:]
+        if end:
+            yield decode_lines(chunk[:end], key, handler)
+
+    if rest:
+        yield decode_lines(rest, key, handler)
+
+
+def character_boundary(data):
+    """Get the position after the last complete UTF-8 character of the data."""
+    for start in range(len(data) - 1, max(len(data) - 4, -1), -1):
+        byte = data[start]
+        # Skip continuation bytes until the first byte of the last character
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte < 0x80:
+            length = 1
+        elif byte < 0xE0:
+            length = 2
+        elif byte < 0xF0:
+            length = 3
+        else:
+            length = 4
+        return len(data) if start + length <= len(data) else start
+    return len(data)
+
+
+def decode_lines(data, key, handler=None):
+    """Decode UTF-8 encoded lines. Invalid lines are replaced by an error message."""
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+
+    lines = []
+    for line in data.splitlines(keepends=True):
         try:
-            line = descriptor.readline()
-            lines += line
+            lines.append(line.decode('utf-8'))
         except UnicodeDecodeError:
             error_msg = "Error while decoding output of process {}".format(key)
             if handler:
                 handler.logger.error("{} with command {}".format(
                     error_msg, handler.queue[key]['command']))
-            lines += error_msg + '\n'
-    return lines.replace('\n', '\n    ')
+            lines.append(error_msg + '\n')
+    return ''.join(lines)
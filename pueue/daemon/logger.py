@@ -3,13 +3,31 @@ import os
 import sys
 import time
 import glob
+import codecs
+import lzma
+import zlib
 import logging
+import threading
 
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 
 from colorclass import Color
 
+from pueue.daemon.files import OUTPUT_CHUNK_SIZE, iter_output
+
+# The first line of every compiled log file.
+LOG_HEADER = 'Pueue log for executed Commands: \n \n'
+
+# The file extensions of rotated logs for each compression.
+LOG_EXTENSIONS = {'none': '', 'zlib': '.gz', 'lzma': '.xz'}
+
+# The key ranges of all rotated logs
+ROTATED_INDEX = 'rotated.index'
+
+# The amount of characters of each output in the current log. Rotated logs contain the whole outputs.
+LOG_OUTPUT_SIZE = 65536
+
 
 class Logger():
     """The logger class which handles all kinds of daemon logging.
@@ -31,6 +49,11 @@ class Logger():
         # Initialize log file for daemon output
         self.daemon_log_path = os.path.join(self.log_dir, 'daemon.log')
 
+        # The compression of rotated logs
+        self.compression = 'none'
+        # Finished processes are logged by the executor of the ProcessHandler
+        self.lock = threading.Lock()
+
         self.logger = logging.getLogger('')
         self.logger.setLevel(logging.INFO)
         log_format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -70,83 +93,328 @@ class Logger():
         self.logger.exception(message)
 
     def rotate(self, log):
-        """Move the current log to a new file with timestamp and create a new empty log file."""
+        """Move the current log to a new file with timestamp and create a new empty log file.
+
+        Rotated logs are compressed with the configured `compression`.
+        """
         self.write(log, rotate=True)
         self.write({})
 
     def write(self, log, rotate=False):
-        """Write the output of all finished processes to a compiled log file."""
+        """Write the output of all finished processes to a compiled log file.
+
+        This regenerates the whole log and its index. While the daemon runs,
+        finished processes are added to the log with `append` instead.
+        """
+        with self.lock:
+            self.write_log(log, rotate)
+
+    def write_log(self, log, rotate):
+        """Write the compiled log file, see `write`."""
         # Get path for logfile
+        compression = 'none'
+        max_output = LOG_OUTPUT_SIZE
         if rotate:
-            timestamp = time.strftime('-%Y%m%d-%H%M')
-            logPath = os.path.join(self.log_dir, 'queue{}.log'.format(timestamp))
+            compression = self.compression
+            max_output = None
+            logPath = self.get_rotated_path(compression)
         else:
             logPath = os.path.join(self.log_dir, 'queue.log')
+            # Remove existing Log
+            if os.path.exists(logPath):
+                os.remove(logPath)
 
-        # Remove existing Log
-        if os.path.exists(logPath):
-            os.remove(logPath)
+        log_file = open(logPath, 'wb')
+        index_file = open(logPath + '.index', 'w')
+        self.write_piece(log_file, LOG_HEADER, compression)
 
-        log_file = open(logPath, 'w')
-        log_file.write('Pueue log for executed Commands: \n \n')
-
-        # Format, color and write log
+        keys = []
         for key, logentry in log.items():
-            if logentry.get('returncode') is not None:
-                try:
-                    # Get returncode color:
-                    returncode = logentry['returncode']
-                    if returncode == 0:
-                        returncode = Color('{autogreen}' + '{}'.format(returncode) + '{/autogreen}')
-                    else:
-                        returncode = Color('{autored}' + '{}'.format(returncode) + '{/autored}')
-
-                    # Write command id with returncode and actual command
-                    log_file.write(
-                        Color('{autoyellow}' + 'Command #{} '.format(key) + '{/autoyellow}') +
-                        'exited with returncode {}: \n'.format(returncode) +
-                        '"{}" \n'.format(logentry['command'])
-                    )
-                    # Write path
-                    log_file.write('Path: {} \n'.format(logentry['path']))
-                    # Write times
-                    log_file.write('Start: {}, End: {} \n'
-                                   .format(logentry['start'], logentry['end']))
-
-                    # Write STDERR
-                    if logentry['stderr']:
-                        log_file.write(Color('{autored}Stderr output: {/autored}\n    ') + logentry['stderr'])
-
-                    # Write STDOUT
-                    if len(logentry['stdout']) > 0:
-                        log_file.write(Color('{autogreen}Stdout output: {/autogreen}\n    ') + logentry['stdout'])
-
-                    log_file.write('\n')
-                except Exception as a:
-                    print('Failed while writing to log file. Wrong file permissions?')
-                    print('Exception: {}'.format(str(a)))
+            if self.write_entry(log_file, index_file, key, logentry, compression, max_output):
+                keys.append(key)
 
+        index_file.close()
         log_file.close()
 
+        # Remember the key range of the rotated log. Lookups only read its index, if it contains the key.
+        if rotate and keys:
+            with open(os.path.join(self.log_dir, ROTATED_INDEX), 'a') as rotated_index:
+                rotated_index.write('{} {} {}\n'.format(min(keys), max(keys), os.path.basename(logPath)))
+
+    def get_rotated_path(self, compression):
+        """Get a new path for a rotated log. Existing rotated logs are never replaced.
+
+        The name contains the time of the rotation. A counter is added, if there
+        are multiple rotations in the same second.
+        """
+        name = time.strftime('queue-%Y%m%d-%H%M%S')
+        counter = 0
+        while True:
+            candidate = name if counter == 0 else '{}-{}'.format(name, counter)
+            paths = [os.path.join(self.log_dir, '{}.log{}'.format(candidate, extension))
+                     for extension in LOG_EXTENSIONS.values()]
+            if not any(os.path.exists(path) or os.path.exists(path + '.index') for path in paths):
+                return os.path.join(self.log_dir, '{}.log{}'.format(candidate, LOG_EXTENSIONS[compression]))
+            counter += 1
+
+    def append(self, log, keys):
+        """Append the output of the newly finished processes to the current log file.
+
+        Only the specified entries are formatted and written, so the costs
+        don't grow with the amount of entries, which finished earlier.
+        Outputs are cut after `LOG_OUTPUT_SIZE` characters.
+        """
+        with self.lock:
+            logPath = os.path.join(self.log_dir, 'queue.log')
+            new_log = not os.path.exists(logPath)
+
+            log_file = open(logPath, 'ab')
+            index_file = open(logPath + '.index', 'w' if new_log else 'a')
+            if new_log:
+                self.write_piece(log_file, LOG_HEADER, 'none')
+
+            for key in keys:
+                self.write_entry(log_file, index_file, key, log[key], 'none', LOG_OUTPUT_SIZE)
+
+            index_file.close()
+            log_file.close()
+
+    def write_piece(self, log_file, text, compression):
+        """Write a piece of the log, which can be decompressed on its own."""
+        compressor = get_log_compressor(compression)
+        data = text.encode('utf-8')
+        if compressor is None:
+            log_file.write(data)
+        else:
+            log_file.write(compressor.compress(data) + compressor.flush())
+
+    def write_entry(self, log_file, index_file, key, logentry, compression, max_output=None):
+        """Write the log of a single finished process and add it to the index.
+
+        Each entry of a compressed log is compressed on its own, so it can be
+        read from its offset without decompressing the entries before it.
+        Outputs are cut after `max_output` characters, if it's given.
+        Returns whether the entry has been written.
+        """
+        if logentry.get('returncode') is None:
+            return False
+        offset = log_file.tell()
+        compressor = get_log_compressor(compression)
+        try:
+            for piece in format_entry(key, logentry, max_output):
+                data = piece.encode('utf-8')
+                if compressor is not None:
+                    data = compressor.compress(data)
+                log_file.write(data)
+            if compressor is not None:
+                log_file.write(compressor.flush())
+            index_file.write('{} {} {}\n'.format(key, offset, log_file.tell() - offset))
+            return True
+        except Exception as a:
+            print('Failed while writing to log file. Wrong file permissions?')
+            print('Exception: {}'.format(str(a)))
+            return False
+
     def remove_old(self, max_log_time):
         """Remove all logs which are older than the specified time."""
         files = glob.glob('{}/queue-*'.format(self.log_dir))
         files = list(map(lambda x: os.path.basename(x), files))
 
+        now = datetime.now()
         for log_file in files:
-            # Get time stamp from filename
-            name = os.path.splitext(log_file)[0]
-            timestamp = name.split('-', maxsplit=1)[1]
-
-            # Get datetime from time stamp
-            time = datetime.strptime(timestamp, '%Y%m%d-%H%M')
-            now = datetime.now()
-
             # Get total delta in seconds
-            delta = now - time
+            delta = now - get_rotation_time(log_file)[0]
             seconds = delta.total_seconds()
 
             # Delete log file, if the delta is bigger than the specified log time
             if seconds > int(max_log_time):
                 log_filePath = os.path.join(self.log_dir, log_file)
                 os.remove(log_filePath)
+
+        # Forget the key ranges of removed logs
+        rotated_index_path = os.path.join(self.log_dir, ROTATED_INDEX)
+        if os.path.exists(rotated_index_path):
+            with open(rotated_index_path) as rotated_index:
+                lines = [line for line in rotated_index
+                         if os.path.exists(os.path.join(self.log_dir, line.split()[2]))]
+            with open(rotated_index_path, 'w') as rotated_index:
+                rotated_index.writelines(lines)
+
+
+def get_rotation_time(name):
+    """Get the time and the counter of a rotated log from its name.
+
+    Names are `queue-%Y%m%d-%H%M%S` with an optional counter, followed by the extensions.
+    Logs of older versions only have minutes in their name.
+    """
+    parts = name.split('.', maxsplit=1)[0].split('-')
+    counter = int(parts[3]) if len(parts) > 3 else 0
+    timestamp = '-'.join(parts[1:3])
+    if len(parts[2]) == 6:
+        return datetime.strptime(timestamp, '%Y%m%d-%H%M%S'), counter
+    return datetime.strptime(timestamp, '%Y%m%d-%H%M'), counter
+
+
+def format_entry(key, logentry, max_output=None):
+    """Yield the formatted and colored log of a finished process in pieces.
+
+    The log contains the command, path, times, returncode and both outputs.
+    Outputs are streamed, they might be huge. With `max_output` they're cut after this many characters.
+    """
+    # Get returncode color:
+    returncode = logentry['returncode']
+    if returncode == 0:
+        returncode = Color('{autogreen}' + '{}'.format(returncode) + '{/autogreen}')
+    else:
+        returncode = Color('{autored}' + '{}'.format(returncode) + '{/autored}')
+
+    # Processes which exceeded their timeout are marked separately
+    timed_out = ''
+    if logentry.get('timed_out'):
+        timed_out = Color('{autored}' + 'timed out after {} seconds'.format(
+            logentry['timeout']) + '{/autored} and ')
+
+    # Command id with returncode and actual command
+    yield (
+        Color('{autoyellow}' + 'Command #{} '.format(key) + '{/autoyellow}') +
+        timed_out + 'exited with returncode {}: \n'.format(returncode) +
+        '"{}" \n'.format(logentry['command'])
+    )
+    # Path
+    yield 'Path: {} \n'.format(logentry['path'])
+    # Times
+    yield 'Start: {}, End: {} \n'.format(logentry['start'], logentry['end'])
+
+    # STDERR
+    for index, stderr in enumerate(iter_log_output(logentry, 'stderr', key, max_output)):
+        if index == 0:
+            yield Color('{autored}Stderr output: {/autored}\n    ')
+        yield stderr
+
+    # STDOUT
+    for index, stdout in enumerate(iter_log_output(logentry, 'stdout', key, max_output)):
+        if index == 0:
+            yield Color('{autogreen}Stdout output: {/autogreen}\n    ')
+        yield stdout
+
+    yield '\n'
+
+
+def iter_log_output(logentry, name, key, max_output=None):
+    """Yield an output of a finished process for the log, see `iter_output`.
+
+    The output is cut after `max_output` characters. The full output can be shown with `pueue log`.
+    """
+    size = 0
+    for piece in iter_output(logentry, name, key):
+        if max_output is not None and size + len(piece) > max_output:
+            yield piece[:max_output - size]
+            yield '\n    [Output cut after {} characters, use `pueue log -k {}` for the whole output]'.format(
+                max_output, key)
+            return
+        size += len(piece)
+        yield piece
+
+
+def get_log_compressor(compression):
+    """Get a compressor, whose output can be read with `gzip` or `xz` respectively.
+
+    Concatenated gzip members and xz streams are valid files as well,
+    so every entry is compressed on its own.
+    """
+    if compression == 'zlib':
+        return zlib.compressobj(wbits=31)
+    elif compression == 'lzma':
+        return lzma.LZMACompressor()
+    return None
+
+
+def get_rotated_log_paths(log_dir, key):
+    """Get the paths of all rotated logs, whose key range contains the key, the newest first."""
+    rotated_index_path = os.path.join(log_dir, ROTATED_INDEX)
+    if not os.path.exists(rotated_index_path):
+        return []
+
+    paths = []
+    with open(rotated_index_path) as rotated_index:
+        for line in rotated_index:
+            min_key, max_key, name = line.split()
+            if int(min_key) <= key <= int(max_key):
+                paths.append(os.path.join(log_dir, name))
+    paths.sort(key=lambda path: get_rotation_time(os.path.basename(path)), reverse=True)
+    return paths
+
+
+def find_log_entry(log_dir, key):
+    """Find the newest log of an entry in the current or the rotated logs.
+
+    The index of the current log is searched first. Afterwards only the indices
+    of the rotated logs, whose key range contains the key, are searched.
+    The search stops at the first log containing the key.
+
+    Returns:
+        (string, int, int): The path of the log file, the offset and the length of the entry.
+        None: If no log contains the entry.
+    """
+    paths = [os.path.join(log_dir, 'queue.log')] + get_rotated_log_paths(log_dir, key)
+    for path in paths:
+        if not os.path.exists(path) or not os.path.exists(path + '.index'):
+            continue
+        location = None
+        with open(path + '.index') as index_file:
+            for line in index_file:
+                index_key, offset, length = line.split()
+                if int(index_key) == key:
+                    location = (path, int(offset), int(length))
+        if location is not None:
+            return location
+
+    return None
+
+
+def iter_log_entry(path, offset, length):
+    """Yield the log of an entry in pieces, see `find_log_entry`.
+
+    The entry is read directly from its offset in the log file and
+    decompressed on the fly, if the log is compressed.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(path, 'rb') as log_file:
+        log_file.seek(offset)
+        chunks = iter_log_chunks(log_file, length)
+        if path.endswith(LOG_EXTENSIONS['zlib']):
+            chunks = iter_zlib_log_chunks(chunks)
+        elif path.endswith(LOG_EXTENSIONS['lzma']):
+            chunks = iter_lzma_log_chunks(chunks)
+        for chunk in chunks:
+            yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def iter_log_chunks(log_file, length):
+    """Read `length` bytes from a log file in chunks of at most `OUTPUT_CHUNK_SIZE` bytes."""
+    while length > 0:
+        data = log_file.read(min(length, OUTPUT_CHUNK_SIZE))
+        if not data:
+            break
+        length -= len(data)
+        yield data
+
+
+def iter_zlib_log_chunks(chunks):
+    """Decompress the gzip member of an entry in chunks of at most `OUTPUT_CHUNK_SIZE` bytes."""
+    decompressor = zlib.decompressobj(wbits=31)
+    for data in chunks:
+        while data:
+            yield decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+def iter_lzma_log_chunks(chunks):
+    """Decompress the xz stream of an entry in chunks of at most `OUTPUT_CHUNK_SIZE` bytes."""
+    decompressor = lzma.LZMADecompressor()
+    for data in chunks:
+        yield decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+        while not decompressor.needs_input and not decompressor.eof:
+            yield decompressor.decompress(b'', OUTPUT_CHUNK_SIZE)
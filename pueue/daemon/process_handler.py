@@ -1,12 +1,18 @@
 import os
 import time
+import heapq
 import signal
 import psutil
 import subprocess
 
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-from pueue.daemon.files import get_descriptor_output
+from pueue.daemon.capture import OutputCapture
+from pueue.daemon.files import compress_output, get_output_path
+
+# The time processes get to exit after their timeout signal, before they're killed.
+TIMEOUT_GRACE_PERIOD = 10
 
 
 class ProcessHandler():
@@ -16,22 +22,52 @@ class ProcessHandler():
     The ProcessHandler is capable of running a pool of processes.
     """
 
-    def __init__(self, queue, logger, config_dir):
+    def __init__(self, queue, logger, config_dir, events):
         """Initialize a new process handler and create member variables."""
         self.config_dir = config_dir
+        # Outputs of finished processes are moved into this directory
+        output_dir = os.path.join(self.config_dir, 'output')
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
         self.queue = queue
         self.logger = logger
+        self.events = events
 
         self.stopped = False
         self.max_processes = 1
         self.custom_shell = None
         self.processes = {}
+        # Map of process ids to queue keys of all running processes
+        self.pids = {}
         self.descriptors = {}
 
         self.paused = []
         self.stopping = []
         self.to_remove = []
         self.to_stash = []
+        # Heap of (deadline, key, pid, action) of running processes.
+        # The action is either `timeout` for entries with a timeout,
+        # or `kill` for terminated processes, which are killed after their grace period.
+        self.deadlines = []
+        # Keys of processes, which have been terminated due to their timeout
+        self.timed_out = set()
+        self.timeout_signal = signal.SIGTERM
+        # The default maximum output size of processes in bytes. `0` means unlimited.
+        self.max_output = 0
+        # The compression of stored outputs of finished processes
+        self.compression = 'zlib'
+        # Output captures of processes with a limited output size
+        self.captures = {}
+        # The event loop, which reads captured outputs. It's set by the daemon.
+        self.loop = None
+        # Outputs of finished processes are stored (and compressed) in the background.
+        # Map of keys to (future, returncode, timed_out, end) of entries, whose outputs are being stored.
+        self.storing = {}
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        # Called in the event loop, once outputs have been stored. It's set by the daemon.
+        self.wake = None
+        # Keys of entries, which failed to spawn and haven't been logged yet
+        self.spawn_failed = []
 
     def set_max(self, amount):
         """Set the amount of concurrent running processes."""
@@ -42,12 +78,12 @@ class ProcessHandler():
         self.custom_shell = path
 
     def is_running(self, key):
-        """Return if there is a running process for this key."""
-        return key in self.processes
+        """Return if there is a running process for this key or its outputs are being stored."""
+        return key in self.processes or key in self.storing
 
     def all_finished(self):
-        """Return `False`, if there are any active processes."""
-        return not bool(len(self.processes))
+        """Return `False`, if there are any active processes or outputs being stored."""
+        return not bool(len(self.processes)) and not bool(len(self.storing))
 
     def wait_for_finish(self):
         """Wait until all processes finished."""
@@ -62,14 +98,14 @@ class ProcessHandler():
                                    'pueue_process_{}.stdout'.format(number))
         if os.path.exists(stdout_path):
             os.remove(stdout_path)
-        out_descriptor = open(stdout_path, 'w+')
+        out_descriptor = open(stdout_path, 'wb+')
 
         # Create stderr file and get file descriptor
         stderr_path = os.path.join(self.config_dir,
                                    'pueue_process_{}.stderr'.format(number))
         if os.path.exists(stderr_path):
             os.remove(stderr_path)
-        err_descriptor = open(stderr_path, 'w+')
+        err_descriptor = open(stderr_path, 'wb+')
 
         self.descriptors[number] = {}
         self.descriptors[number]['stdout'] = out_descriptor
@@ -89,61 +125,142 @@ class ProcessHandler():
         if os.path.exists(self.descriptors[number]['stderr_path']):
             os.remove(self.descriptors[number]['stderr_path'])
 
-    def check_finished(self):
-        """Poll all processes and handle any finished processes."""
-        changed = False
-        for key in list(self.processes.keys()):
-            # Poll process and check if it finshed
-            process = self.processes[key]
-            process.poll()
-            if process.returncode is not None:
-                # If a process is terminated by `stop` or `kill`
-                # we want to queue it again instead closing it as failed.
-                if key not in self.stopping:
-                    # Get std_out and err_out
-                    output, error_output = process.communicate()
-
-                    descriptor = self.descriptors[key]
-                    descriptor['stdout'].seek(0)
-                    descriptor['stderr'].seek(0)
-                    output = get_descriptor_output(descriptor['stdout'], key, handler=self)
-                    error_output = get_descriptor_output(descriptor['stderr'], key, handler=self)
-
-                    # Mark queue entry as finished and save returncode
-                    self.queue[key]['returncode'] = process.returncode
-                    if process.returncode != 0:
-                        self.queue[key]['status'] = 'failed'
-                    else:
-                        self.queue[key]['status'] = 'done'
+    def store_output(self, key, returncode, timed_out):
+        """Start to log the finished process and to move its output files into the output directory.
+
+        This is done by the executor, as reading and compressing huge outputs
+        would block the daemon. The entry is finished in `finish_entry`, once the outputs are stored.
+        Until then, the raw output files are kept and the entry stays `running`.
+        """
+        for name in ['stdout', 'stderr']:
+            self.descriptors[key][name].close()
+
+        # Mark queue entry as finished and save returncode
+        finished = {'returncode': returncode, 'end': str(datetime.now().strftime("%H:%M"))}
+        if timed_out:
+            # Processes which exceeded their timeout always fail
+            finished['timed_out'] = True
+            finished['status'] = 'failed'
+        elif returncode != 0:
+            finished['status'] = 'failed'
+        else:
+            finished['status'] = 'done'
+
+        entry = dict(self.queue[key], **finished)
+        future = self.executor.submit(store_outputs, self.config_dir, key, entry,
+                                      self.descriptors[key], self.compression, self.logger)
+        if self.wake is not None:
+            future.add_done_callback(lambda future: self.loop.call_soon_threadsafe(self.wake))
+        self.storing[key] = (future, finished)
+
+    def finish_entry(self, key):
+        """Mark an entry as finished, whose outputs have been stored."""
+        future, finished = self.storing.pop(key)
+        entry = self.queue[key]
+        entry.update(finished)
+
+        # Reference the stored outputs in the queue
+        try:
+            entry.update(future.result())
+        except Exception:
+            self.logger.error('Failed to store the output of process {}.'.format(key))
+            self.logger.exception()
+
+        self.queue.commit(key)
+        self.publish_finished(key)
+        self.clean_descriptor(key)
+
+    def finished_keys(self):
+        """Reap all exited processes and return their keys.
+
+        `waitid` with `WNOWAIT` tells us which child exited without reaping it.
+        Only this process is then polled, which reaps it and sets its returncode.
+        Thereby we only touch processes that actually finished, instead of polling
+        every running process.
+        Platforms without `waitid` fall back to polling all processes.
+        """
+        if not hasattr(os, 'waitid'):
+            finished = []
+            for key, process in self.processes.items():
+                if process.poll() is not None:
+                    del self.pids[process.pid]
+                    finished.append(key)
+            return finished
+
+        finished = []
+        while True:
+            try:
+                info = os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+            except ChildProcessError:
+                # There are no child processes at all
+                break
+            if info is None:
+                break
+
+            key = self.pids.pop(info.si_pid, None)
+            if key is None:
+                # This isn't one of our processes. Reap it, otherwise
+                # `waitid` would report this process again and again.
+                os.waitpid(info.si_pid, os.WNOHANG)
+                continue
+            self.processes[key].poll()
+            finished.append(key)
 
-                    # Add outputs to queue
-                    self.queue[key]['stdout'] = output
-                    self.queue[key]['stderr'] = error_output
-                    self.queue[key]['end'] = str(datetime.now().strftime("%H:%M"))
+        return finished
 
-                    self.queue.write()
-                    changed = True
+    def check_finished(self):
+        """Handle all processes which finished since the last check.
+
+        Finished entries are logged while their outputs are stored. They're only
+        marked as `done` or `failed`, once their outputs are stored.
+        Returns the keys of all entries, which finished and still need to be logged.
+        """
+        # Entries, which failed to spawn, are logged as well
+        finished = [key for key in self.spawn_failed if key in self.queue]
+        self.spawn_failed = []
+        for key in self.finished_keys():
+            process = self.processes[key]
+            self.finish_capture(key)
+            # Close stdin
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+            # If a process is terminated by `stop` or `kill`
+            # we want to queue it again instead closing it as failed.
+            if key not in self.stopping:
+                # The entry is finished, once its outputs are stored
+                self.store_output(key, process.returncode, key in self.timed_out)
+                self.timed_out.discard(key)
+            else:
+                self.timed_out.discard(key)
+                self.stopping.remove(key)
+                if key in self.to_remove:
+                    self.to_remove.remove(key)
+                    del self.queue[key]
+                    self.events.publish('removed', keys=[key])
                 else:
-                    self.stopping.remove(key)
-                    if key in self.to_remove:
-                        self.to_remove.remove(key)
-                        del self.queue[key]
+                    if key in self.to_stash:
+                        self.to_stash.remove(key)
+                        self.queue[key]['status'] = 'stashed'
                     else:
-                        if key in self.to_stash:
-                            self.to_stash.remove(key)
-                            self.queue[key]['status'] = 'stashed'
-                        else:
-                            self.queue[key]['status'] = 'queued'
-                        self.queue[key]['start'] = ''
-                        self.queue[key]['end'] = ''
-
-                    self.queue.write()
+                        self.queue[key]['status'] = 'queued'
+                    self.queue[key]['start'] = ''
+                    self.queue[key]['end'] = ''
+                    self.events.publish('stopped', key=key, status=self.queue[key]['status'])
 
+                self.queue.commit(key)
                 self.clean_descriptor(key)
-                del self.processes[key]
 
-        # If anything should be logged we return True
-        return changed
+            del self.processes[key]
+
+        # Finish all entries, whose outputs have been stored
+        for key in [key for key, storing in self.storing.items() if storing[0].done()]:
+            self.finish_entry(key)
+
+        # The entries which should be logged
+        return finished
 
     def check_for_new(self):
         """Check if we can start a new process."""
@@ -166,39 +283,100 @@ class ProcessHandler():
         else:
             # Get file descriptors
             stdout, stderr = self.get_descriptor(key)
-
-            if self.custom_shell != 'default':
-                # Create subprocess
-                self.processes[key] = subprocess.Popen(
-                    [
-                        self.custom_shell,
-                        '-i',
-                        '-c',
+            max_output = self.queue[key].get('max_output')
+            if max_output is None:
+                max_output = self.max_output
+            if self.queue[key].get('discard_output'):
+                stdout = stderr = subprocess.DEVNULL
+            elif max_output:
+                # The output is read by the daemon, which only keeps its head and tail.
+                stdout = stderr = subprocess.PIPE
+
+            try:
+                if self.custom_shell != 'default':
+                    # Create subprocess
+                    self.processes[key] = subprocess.Popen(
+                        [
+                            self.custom_shell,
+                            '-i',
+                            '-c',
+                            self.queue[key]['command'],
+                        ],
+                        stdout=stdout,
+                        stderr=stderr,
+                        stdin=subprocess.PIPE,
+                        universal_newlines=True,
+                        preexec_fn=os.setsid,
+                        cwd=self.queue[key]['path']
+                    )
+                else:
+                    # Create subprocess
+                    self.processes[key] = subprocess.Popen(
                         self.queue[key]['command'],
-                    ],
-                    stdout=stdout,
-                    stderr=stderr,
-                    stdin=subprocess.PIPE,
-                    universal_newlines=True,
-                    preexec_fn=os.setsid,
-                    cwd=self.queue[key]['path']
-                )
+                        shell=True,
+                        stdout=stdout,
+                        stderr=stderr,
+                        stdin=subprocess.PIPE,
+                        universal_newlines=True,
+                        preexec_fn=os.setsid,
+                        cwd=self.queue[key]['path']
+                    )
+            except OSError as error:
+                # E.g. the command exceeds the maximum argument length
+                self.clean_descriptor(key)
+                self.queue[key]['status'] = 'failed'
+                error_msg = "Couldn't spawn process: {}".format(error)
+                self.logger.error(error_msg)
+                self.queue[key]['stdout'] = ''
+                self.queue[key]['stderr'] = error_msg
             else:
-                # Create subprocess
-                self.processes[key] = subprocess.Popen(
-                    self.queue[key]['command'],
-                    shell=True,
-                    stdout=stdout,
-                    stderr=stderr,
-                    stdin=subprocess.PIPE,
-                    universal_newlines=True,
-                    preexec_fn=os.setsid,
-                    cwd=self.queue[key]['path']
-                )
-            self.queue[key]['status'] = 'running'
-            self.queue[key]['start'] = str(datetime.now().strftime("%H:%M"))
-
-        self.queue.write()
+                pid = self.processes[key].pid
+                self.pids[pid] = key
+                if stdout == subprocess.PIPE:
+                    self.capture_output(key, max_output)
+                self.queue[key]['status'] = 'running'
+                self.queue[key]['start'] = str(datetime.now().strftime("%H:%M"))
+                if self.queue[key].get('timeout'):
+                    heapq.heappush(self.deadlines, (time.monotonic() + self.queue[key]['timeout'], key, pid, 'timeout'))
+
+        self.queue.commit(key)
+        if self.queue[key]['status'] == 'running':
+            self.events.publish('started', key=key)
+        else:
+            self.publish_finished(key)
+            # The failed entry is logged by the next `check_finished`
+            self.spawn_failed.append(key)
+            if self.wake is not None:
+                self.wake()
+
+    def capture_output(self, key, max_size):
+        """Read the outputs of a process from its pipes, whenever they are readable."""
+        process = self.processes[key]
+        self.captures[key] = []
+        for name, pipe in [('stdout', process.stdout), ('stderr', process.stderr)]:
+            capture = OutputCapture(pipe, self.descriptors[key][name], max_size)
+            self.loop.add_reader(capture.fileno(), self.read_capture, capture)
+            self.captures[key].append(capture)
+
+    def read_capture(self, capture):
+        """Read the available output of a capture and stop watching its pipe once it's closed."""
+        if not capture.read():
+            self.loop.remove_reader(capture.fileno())
+
+    def finish_capture(self, key):
+        """Stop capturing the output of a process and write the captured tail."""
+        for capture in self.captures.pop(key, []):
+            self.loop.remove_reader(capture.fileno())
+            capture.finish()
+
+    def publish_finished(self, key):
+        """Notify subscribers about a finished entry."""
+        self.events.publish(
+            'finished',
+            key=key,
+            status=self.queue[key]['status'],
+            returncode=self.queue[key]['returncode'],
+        )
 
     def send_to_process(self, message, key):
         self.processes[key].stdin.write(message)
@@ -220,15 +398,19 @@ class ProcessHandler():
 
     def kill_all(self, kill_signal, kill_shell=False):
         """Kill all running processes."""
+        # The process tree is only needed without `kill_shell`. It's scanned once for all processes.
+        tree = None if kill_shell else process_tree()
         for key in self.processes.keys():
-            self.kill_process(key, kill_signal, kill_shell)
+            self.kill_process(key, kill_signal, kill_shell, tree)
 
     def start_process(self, key):
         """Start a specific processes."""
         if key in self.processes and key in self.paused:
             os.killpg(os.getpgid(self.processes[key].pid), signal.SIGCONT)
             self.queue[key]['status'] = 'running'
+            self.queue.commit(key)
             self.paused.remove(key)
+            self.events.publish('resumed', key=key)
             return True
         elif key not in self.processes:
             if self.queue[key]['status'] in ['queued', 'stashed']:
@@ -242,21 +424,155 @@ class ProcessHandler():
         if key in self.processes and key not in self.paused:
             os.killpg(os.getpgid(self.processes[key].pid), signal.SIGSTOP)
             self.queue[key]['status'] = 'paused'
+            self.queue.commit(key)
             self.paused.append(key)
+            self.events.publish('paused', key=key)
             return True
         return False
 
-    def kill_process(self, key, kill_signal, kill_shell=False):
+    def terminate_process(self, key, grace, term_signal=signal.SIGTERM):
+        """Send `term_signal` to the process group of a process and `SIGKILL` after `grace` seconds.
+
+        The process is only killed by `check_deadlines`, if it's still running by then.
+        """
+        process = self.processes.get(key)
+        if process is None or process.returncode is not None:
+            return False
+
+        try:
+            os.killpg(os.getpgid(process.pid), term_signal)
+            # Paused processes need to continue to handle the signal
+            if key in self.paused:
+                os.killpg(os.getpgid(process.pid), signal.SIGCONT)
+        except ProcessLookupError:
+            return False
+        heapq.heappush(self.deadlines, (time.monotonic() + grace, key, process.pid, 'kill'))
+        return True
+
+    def terminate_all(self, grace):
+        """Terminate all running processes with a grace period."""
+        for key in self.processes.keys():
+            self.terminate_process(key, grace)
+
+    def is_alive(self, key, pid):
+        """Check whether the process of a deadline is still running."""
+        process = self.processes.get(key)
+        return process is not None and process.pid == pid and process.returncode is None
+
+    def check_deadlines(self):
+        """Handle all deadlines, which are due.
+
+        Processes, which exceeded their timeout, get the `timeout_signal`.
+        Terminated processes, whose grace period is over, are killed.
+        """
+        now = time.monotonic()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, key, pid, action = heapq.heappop(self.deadlines)
+            if not self.is_alive(key, pid):
+                continue
+            if action == 'timeout':
+                self.logger.info('Process {} exceeded its timeout.'.format(key))
+                self.timed_out.add(key)
+                self.terminate_process(key, TIMEOUT_GRACE_PERIOD, self.timeout_signal)
+            else:
+                self.logger.info('Process {} ignored SIGTERM. Sending SIGKILL.'.format(key))
+                signal_group(pid, signal.SIGKILL)
+
+    def deadline_timeout(self):
+        """Get the seconds until the next deadline, or `None` if there is none."""
+        # Forget deadlines of processes, which exited on their own.
+        while self.deadlines and not self.is_alive(*self.deadlines[0][1:3]):
+            heapq.heappop(self.deadlines)
+        if not self.deadlines:
+            return None
+        return max(0, self.deadlines[0][0] - time.monotonic())
+
+    def kill_process(self, key, kill_signal, kill_shell=False, tree=None):
+        """Send a signal to a process.
+
+        Processes are started in their own session (`os.setsid`), which makes the shell the
+        leader of a process group containing all processes of the task.
+        With `kill_shell` the signal is sent to the whole process group with a single call.
+        Otherwise the shell is spared and the process tree is walked to signal all of its descendants.
+        `tree` is a snapshot of the process tree (see `process_tree`). It's created, if it isn't given.
+        """
         if key in self.processes:
-            self.processes[key].poll()
+            # Don't poll the process here. Processes are only reaped in `finished_keys`,
+            # which otherwise wouldn't be notified about this process' exit.
+            # An exited but unreaped process is a zombie, which is safe to signal.
             if self.processes[key].returncode is None:
-                # Kill process
-                shell_process = psutil.Process(self.processes[key].pid)
-                children = shell_process.children()
-                if kill_shell or len(children) == 0:
-                    shell_process.send_signal(kill_signal)
-                for child in children:
-                    child.send_signal(kill_signal)
-
+                pid = self.processes[key].pid
+                if kill_shell:
+                    signal_group(pid, kill_signal)
+                elif not signal_descendants(pid, kill_signal, tree or process_tree()):
+                    # There are no children (yet), signal the shell
+                    signal_group(pid, kill_signal)
                 return True
         return False
+
+
+def process_tree():
+    """Map the pids of all processes to the pids of their children."""
+    tree = {}
+    for process in psutil.process_iter(['pid', 'ppid']):
+        tree.setdefault(process.info['ppid'], []).append(process.info['pid'])
+    return tree
+
+
+def signal_group(pid, kill_signal):
+    """Send a signal to the process group of a process."""
+    try:
+        os.killpg(os.getpgid(pid), kill_signal)
+    except ProcessLookupError:
+        # The process group is already gone
+        pass
+
+
+def signal_descendants(pid, kill_signal, tree):
+    """Send a signal to all descendants of a process and return whether there were any.
+
+    This also reaches processes, which left the process group of the task.
+    """
+    found = False
+    children = list(tree.get(pid, []))
+    while children:
+        child = children.pop()
+        children.extend(tree.get(child, []))
+        found = True
+        try:
+            os.kill(child, kill_signal)
+        except ProcessLookupError:
+            # The process exited in the meantime
+            pass
+    return found
+
+
+def store_outputs(config_dir, key, entry, descriptors, compression, logger):
+    """Log a finished process and store its output files in the output directory.
+
+    The process is logged with its raw outputs, before they're compressed.
+    Non-empty outputs are compressed with the given compression.
+    The queue entry only references the files by path and size.
+    Thereby the outputs are neither kept in memory nor written with the queue.
+    This runs in the executor of the `ProcessHandler`, it must not touch the queue.
+    The raw output files are removed by `clean_descriptor` afterwards.
+    """
+    raw_entry = dict(entry)
+    for name in ['stdout', 'stderr']:
+        source_path = descriptors[name + '_path']
+        raw_entry[name] = {'path': source_path, 'size': os.path.getsize(source_path)}
+    logger.append({key: raw_entry}, [key])
+
+    outputs = {}
+    for name in ['stdout', 'stderr']:
+        source_path = descriptors[name + '_path']
+        path = get_output_path(config_dir, key, name)
+        size = raw_entry[name]['size']
+        output_compression = compression if size > 0 else 'none'
+        outputs[name] = {
+            'path': path,
+            'size': size,
+            'compression': output_compression,
+            'stored_size': compress_output(source_path, path, output_compression),
+        }
+    return outputs
@@ -1,23 +1,120 @@
 """Queue implementation."""
 import os
+import time
+import uuid
+import heapq
 import pickle
 
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from pueue.daemon.files import remove_output, write_atomically
+
+# The journal is compacted into a new snapshot once it's bigger than
+# the last snapshot, but not before it reached this size.
+COMPACTION_SIZE = 1048576
+
+# Only this many removed keys are remembered for incremental status requests.
+MAX_TOMBSTONES = 10000
+
+
+def read_snapshot(queue_path):
+    """Read a queue snapshot and return its generation and the queue itself.
+
+    Snapshots of old pueue versions only contain the queue. They get generation `0`.
+    """
+    with open(queue_path, 'rb') as queue_file:
+        snapshot = pickle.load(queue_file)
+    if isinstance(snapshot, dict):
+        return 0, snapshot
+    return snapshot
+
+
+def replay_journal(journal_path, generation, queue):
+    """Apply all changes of the journal to a queue snapshot.
+
+    The first record of the journal is the generation of the snapshot it is based on.
+    All other records are `(key, entry)` tuples, where `entry` is `None` for removed entries.
+    A truncated record at the end of the journal, e.g. due to a crash while writing it,
+    is ignored together with all following data.
+
+    Returns:
+        bool: `False` if the journal is based on a newer snapshot than the given one.
+              This happens, if the journal got compacted while reading the snapshot.
+
+    """
+    if not os.path.exists(journal_path):
+        return True
+
+    with open(journal_path, 'rb') as journal_file:
+        try:
+            journal_generation = pickle.load(journal_file)
+        except Exception:
+            return True
+        # The journal is older than the snapshot. All changes are already in the snapshot.
+        if journal_generation < generation:
+            return True
+        elif journal_generation > generation:
+            return False
+
+        while True:
+            try:
+                key, entry = pickle.load(journal_file)
+            except Exception:
+                break
+            if entry is None:
+                queue.pop(key, None)
+            else:
+                queue[key] = entry
+    return True
+
 
 class Queue():
     """The task queue representation.
 
     All tasks, task states and process outputs are stored inside.
+
+    The queue is persisted as a snapshot (`queue`) and an append-only journal
+    (`queue.journal`). Every change of an entry is appended to the journal,
+    which keeps the cost of a change independent of the size of the queue.
+    Once the journal grew bigger than the snapshot, both are compacted into a new snapshot.
+
+    Changes aren't written immediately. `commit` only marks an entry as dirty and
+    the daemon calls `flush` once per loop iteration, which writes all dirty
+    entries at once. `flush_interval` allows to flush less often.
+
+    The keys of all `queued` entries are kept in a min-heap, which is updated on `commit`.
+    Keys of entries that aren't queued anymore are only removed once they reach the top
+    of the heap. Thereby `next` doesn't need to scan the whole queue.
+
+    Every change increases the `revision` of the queue. The revision of the last change
+    of every entry and of every removed key (tombstone) is remembered, ordered by revision.
+    This allows clients to request only the changes since the last status they've received.
+    Revisions are only valid during a `session` of the daemon.
     """
 
     def __init__(self, config_dir):
         """Create a new queue and initialize it with a previous queue, if existing."""
         self.config_dir = config_dir
+        self.queue_path = os.path.join(self.config_dir, 'queue')
+        self.journal_path = os.path.join(self.config_dir, 'queue.journal')
+        self.journal = None
+        self.snapshot_size = 0
+        self.dirty = set()
+        self.scheduled = []
+        self.scheduled_keys = set()
+        self.flush_interval = 0
+        self.last_flush = time.time()
+        self.session = uuid.uuid4().hex
+        self.revision = 0
+        self.base_revision = 0
+        self.revisions = OrderedDict()
+        self.tombstones = OrderedDict()
         self.read()
         self.clean()
-        if len(self.queue) > 0:
-            self.next_key = max(self.queue.keys()) + 1
-        else:
-            self.next_key = 0
+        self.next_key = max(self.keys(), default=-1) + 1
+        # Compact the replayed journal and start a new one.
+        self.write()
 
     def keys(self):
         """Return queue keys."""
@@ -27,6 +124,10 @@ class Queue():
         """Length information about the queue."""
         return len(self.queue)
 
+    def __contains__(self, key):
+        """Check whether there is an entry for this key."""
+        return key in self.queue
+
     def __getitem__(self, key):
         """Get an item from the queue."""
         return self.queue[key]
@@ -47,10 +148,28 @@ class Queue():
         """Get an item from the queue."""
         return self.queue.get(key)
 
+    def select(self, statuses=None, min_key=None, max_key=None):
+        """Get all entries with one of the given statuses inside of a key range, ordered by key."""
+        keys = sorted(self.queue.keys())
+        if min_key is not None:
+            keys = keys[bisect_left(keys, min_key):]
+        if max_key is not None:
+            keys = keys[:bisect_right(keys, max_key)]
+        # Entries are yielded lazily, so paginated status requests stop early.
+        for key in keys:
+            entry = self.queue[key]
+            if statuses is None or entry['status'] in statuses:
+                yield key, entry
+
     def reset(self):
         """Reset the queue."""
+        for key in self.queue.keys():
+            remove_output(self.config_dir, key)
         self.queue = {}
         self.next_key = 0
+        self.scheduled = []
+        self.scheduled_keys = set()
+        self.reset_revisions()
         self.write()
 
     def clean(self):
@@ -59,6 +178,7 @@ class Queue():
         In case a previous session crashed and there are still some running
         entries in the queue ('running', 'stopping', 'killing'), we clean those
         and enqueue them again.
+        Afterwards the heap of queued entries is built.
         """
         for _, item in self.queue.items():
             if item['status'] in ['paused', 'running', 'stopping', 'killing']:
@@ -66,12 +186,20 @@ class Queue():
                 item['start'] = ''
                 item['end'] = ''
 
+        self.scheduled = [key for key, item in self.queue.items() if item['status'] == 'queued']
+        heapq.heapify(self.scheduled)
+        self.scheduled_keys = set(self.scheduled)
+
     def clear(self):
-        """Remove all completed tasks from the queue."""
+        """Remove all completed tasks from the queue and return their keys."""
+        removed = []
         for key in list(self.queue.keys()):
             if self.queue[key]['status'] in ['done', 'failed']:
                 del self.queue[key]
-        self.write()
+                remove_output(self.config_dir, key)
+                self.commit(key)
+                removed.append(key)
+        return removed
 
     def next(self):
         """Get the next processable item of the queue.
@@ -83,80 +211,194 @@ class Queue():
             Int: If a valid entry is found.
 
         """
-        smallest = None
-        for key in self.queue.keys():
-            if self.queue[key]['status'] == 'queued':
-                if smallest is None or key < smallest:
-                    smallest = key
-        return smallest
+        while self.scheduled:
+            key = self.scheduled[0]
+            item = self.queue.get(key)
+            if item is not None and item['status'] == 'queued':
+                return key
+            # The entry has been removed or isn't queued anymore.
+            heapq.heappop(self.scheduled)
+            self.scheduled_keys.remove(key)
+        return None
 
     def read(self):
-        """Read the queue of the last pueue session or set `self.queue = {}`."""
-        queue_path = os.path.join(self.config_dir, 'queue')
-        if os.path.exists(queue_path):
-            queue_file = open(queue_path, 'rb')
+        """Read the queue of the last pueue session or set `self.queue = {}`.
+
+        The last snapshot is loaded and all changes from the journal are replayed on top of it.
+        """
+        self.generation = 0
+        self.queue = {}
+        if os.path.exists(self.queue_path):
             try:
-                self.queue = pickle.load(queue_file)
+                self.generation, self.queue = read_snapshot(self.queue_path)
             except Exception:
                 print('Queue file corrupted, deleting old queue')
-                os.remove(queue_path)
-                self.queue = {}
-            queue_file.close()
-        else:
-            self.queue = {}
+                os.remove(self.queue_path)
+                return
+        replay_journal(self.journal_path, self.generation, self.queue)
 
     def write(self):
-        """Write the current queue to a file. We need this to continue an earlier session."""
-        queue_path = os.path.join(self.config_dir, 'queue')
-        queue_file = open(queue_path, 'wb+')
+        """Write a snapshot of the current queue and start a new journal.
+
+        We need this to continue an earlier session.
+        The snapshot gets a new generation, which is written as first record into the new journal.
+        Readers use this to detect whether a journal belongs to the snapshot they've read.
+        Both files are replaced atomically, so readers never see a partially written file.
+        """
+        self.generation += 1
         try:
-            pickle.dump(self.queue, queue_file, -1)
+            write_atomically(self.queue_path, pickle.dumps((self.generation, self.queue), -1))
+            self.snapshot_size = os.path.getsize(self.queue_path)
+
+            # Replace the old journal with an empty one, which only contains the new generation.
+            if self.journal is not None:
+                self.journal.close()
+            write_atomically(self.journal_path, pickle.dumps(self.generation, -1))
+            self.journal = open(self.journal_path, 'ab')
         except Exception:
             print('Error while writing to queue file. Wrong file permissions?')
-        queue_file.close()
+
+        # The snapshot contains all changes
+        self.dirty = set()
+        self.last_flush = time.time()
+
+    def commit(self, key):
+        """Mark an entry as changed.
+
+        This needs to be called after every change of an entry.
+        If the entry has been removed from the queue, its removal is recorded.
+        The change is written to the journal on the next `flush`.
+        """
+        self.dirty.add(key)
+        item = self.queue.get(key)
+        self.record_change(key, item is None)
+
+        # Schedule the entry, if it has been (re-)queued.
+        if item is not None and item['status'] == 'queued' and key not in self.scheduled_keys:
+            heapq.heappush(self.scheduled, key)
+            self.scheduled_keys.add(key)
+
+    def record_change(self, key, removed=False):
+        """Increase the revision and remember it as the last change of an entry."""
+        self.revision += 1
+        self.revisions.pop(key, None)
+        self.tombstones.pop(key, None)
+        if not removed:
+            self.revisions[key] = self.revision
+            return
+
+        self.tombstones[key] = self.revision
+        if len(self.tombstones) > MAX_TOMBSTONES:
+            # Forget the oldest tombstone. Older revisions can't be answered with changes anymore.
+            _, self.base_revision = self.tombstones.popitem(last=False)
+
+    def reset_revisions(self):
+        """Forget all revisions, e.g. after a reset of the queue."""
+        self.revision += 1
+        self.base_revision = self.revision
+        self.revisions = OrderedDict()
+        self.tombstones = OrderedDict()
+
+    def changes_since(self, revision):
+        """Get the keys of all entries, which changed or were removed after `revision`.
+
+        Returns:
+            (list, list): The keys of changed and of removed entries.
+            None: If the changes since this revision aren't known.
+        """
+        if revision < self.base_revision or revision > self.revision:
+            return None
+
+        changes = []
+        for revisions in [self.revisions, self.tombstones]:
+            keys = []
+            for key in reversed(revisions):
+                if revisions[key] <= revision:
+                    break
+                keys.append(key)
+            changes.append(sorted(keys))
+        return tuple(changes)
+
+    def flush(self, force=False):
+        """Append the state of all changed entries to the journal.
+
+        All changes are written in one go. Nothing is written, if the last flush
+        happened less than `flush_interval` seconds ago, unless `force` is given.
+        """
+        if not self.dirty:
+            return
+        if not force and time.time() - self.last_flush < self.flush_interval:
+            return
+
+        records = b''.join(pickle.dumps((key, self.queue.get(key)), -1) for key in self.dirty)
+        self.dirty = set()
+        self.last_flush = time.time()
+        try:
+            self.journal.write(records)
+            self.journal.flush()
+        except Exception:
+            print('Error while writing to queue journal. Wrong file permissions?')
+
+        if self.journal.tell() > max(self.snapshot_size, COMPACTION_SIZE):
+            self.write()
+
+    def flush_timeout(self):
+        """Return the seconds until the next flush is due or `None`, if there are no changes."""
+        if not self.dirty:
+            return None
+        return max(0, self.last_flush + self.flush_interval - time.time())
 
     def add_new(self, command):
-        """Add a new entry to the queue."""
-        self.queue[self.next_key] = command
-        self.queue[self.next_key]['status'] = 'queued'
-        self.queue[self.next_key]['returncode'] = ''
-        self.queue[self.next_key]['stdout'] = ''
-        self.queue[self.next_key]['stderr'] = ''
-        self.queue[self.next_key]['start'] = ''
-        self.queue[self.next_key]['end'] = ''
+        """Add a new entry to the queue and return its key."""
+        command['status'] = 'queued'
+        command['returncode'] = ''
+        command['stdout'] = ''
+        command['stderr'] = ''
+        command['start'] = ''
+        command['end'] = ''
+        command['timed_out'] = False
+        command.setdefault('timeout', None)
+        command.setdefault('max_output', None)
+        command.setdefault('discard_output', False)
+        self[self.next_key] = command
 
+        self.commit(self.next_key)
         self.next_key += 1
-        self.write()
+        return self.next_key - 1
 
     def remove(self, key):
         """Remove a key from the queue, return `False` if no such key exists."""
-        if key in self.queue:
-            del self.queue[key]
-            self.write()
+        if key in self:
+            del self[key]
+            remove_output(self.config_dir, key)
+            self.commit(key)
             return True
         return False
 
     def restart(self, key):
         """Restart a previously finished entry."""
-        if key in self.queue:
-            if self.queue[key]['status'] in ['failed', 'done']:
-                new_entry = {'command': self.queue[key]['command'],
-                             'path': self.queue[key]['path']}
+        if key in self:
+            if self[key]['status'] in ['failed', 'done']:
+                new_entry = {'command': self[key]['command'],
+                             'path': self[key]['path'],
+                             'timeout': self[key].get('timeout'),
+                             'max_output': self[key].get('max_output'),
+                             'discard_output': self[key].get('discard_output', False)}
                 self.add_new(new_entry)
-                self.write()
                 return True
         return False
 
     def switch(self, first, second):
         """Switch two entries in the queue. Return False if an entry doesn't exist."""
         allowed_states = ['queued', 'stashed']
-        if first in self.queue and second in self.queue \
-                and self.queue[first]['status'] in allowed_states\
-                and self.queue[second]['status'] in allowed_states:
+        if first in self and second in self \
+                and self[first]['status'] in allowed_states\
+                and self[second]['status'] in allowed_states:
 
-            tmp = self.queue[second].copy()
-            self.queue[second] = self.queue[first].copy()
-            self.queue[first] = tmp
-            self.write()
+            tmp = self[second].copy()
+            self[second] = self[first].copy()
+            self[first] = tmp
+            self.commit(first)
+            self.commit(second)
             return True
         return False
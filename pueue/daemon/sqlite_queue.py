@@ -0,0 +1,226 @@
+"""SQLite storage backend for the queue."""
+import os
+import time
+import pickle
+import sqlite3
+
+from urllib.parse import quote
+
+from pueue.daemon.files import remove_output
+from pueue.daemon.queue import Queue, read_snapshot, replay_journal
+
+
+def read_database(database_path):
+    """Read all entries of a queue database without modifying it."""
+    uri = 'file:{}?mode=ro'.format(quote(database_path))
+    connection = sqlite3.connect(uri, uri=True)
+    try:
+        rows = connection.execute('SELECT key, entry FROM queue')
+        return {key: pickle.loads(entry) for key, entry in rows}
+    finally:
+        connection.close()
+
+
+class SqliteQueue(Queue):
+    """The task queue stored in a SQLite database (`queue.sqlite`).
+
+    Instead of holding all entries in memory, every entry is stored pickled in
+    its own row, together with its status. The index on status and key turns
+    `next`, `clear` and status queries into index lookups.
+    Entries are only cached in memory until the next flush. This keeps
+    entries, which are modified in place, alive until `commit` is called.
+
+    `commit` writes changes right away, but inside of a transaction.
+    The transaction is committed by `flush`, which batches all changes of a
+    loop iteration (or of `flush_interval` seconds) into a single transaction.
+    """
+
+    def __init__(self, config_dir):
+        """Open the queue database and initialize the queue."""
+        self.database_path = os.path.join(config_dir, 'queue.sqlite')
+        self.cache = {}
+        super().__init__(config_dir)
+
+    def keys(self):
+        """Return queue keys."""
+        return [row[0] for row in self.connection.execute('SELECT key FROM queue ORDER BY key')]
+
+    def __len__(self):
+        """Length information about the queue."""
+        return self.connection.execute('SELECT COUNT(*) FROM queue').fetchone()[0]
+
+    def __contains__(self, key):
+        """Check whether there is an entry for this key."""
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        """Get an item from the cache or load it from the database."""
+        if key in self.cache:
+            entry = self.cache[key]
+        else:
+            row = self.connection.execute('SELECT entry FROM queue WHERE key = ?', (key,)).fetchone()
+            entry = pickle.loads(row[0]) if row is not None else None
+            if entry is not None:
+                self.cache[key] = entry
+
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, value):
+        """Set an item in the queue. The change is written on `commit`."""
+        self.cache[key] = value
+
+    def __delitem__(self, key):
+        """Delete an item from the queue. The removal is written on `commit`."""
+        if key not in self:
+            raise KeyError(key)
+        self.cache[key] = None
+
+    def items(self):
+        """Get all items from the queue."""
+        for key, entry in self.connection.execute('SELECT key, entry FROM queue ORDER BY key'):
+            yield key, self.cache.get(key) or pickle.loads(entry)
+
+    def get(self, key):
+        """Get an item from the queue."""
+        try:
+            return self[key]
+        except KeyError:
+            return None
+
+    def select(self, statuses=None, min_key=None, max_key=None):
+        """Get all entries with one of the given statuses inside of a key range, ordered by key."""
+        conditions = []
+        parameters = []
+        if statuses is not None:
+            conditions.append('status IN ({})'.format(', '.join('?' * len(statuses))))
+            parameters.extend(statuses)
+        if min_key is not None:
+            conditions.append('key >= ?')
+            parameters.append(min_key)
+        if max_key is not None:
+            conditions.append('key <= ?')
+            parameters.append(max_key)
+
+        query = 'SELECT key, entry FROM queue'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY key'
+        for key, entry in self.connection.execute(query, parameters):
+            yield key, self.cache.get(key) or pickle.loads(entry)
+
+    def reset(self):
+        """Reset the queue."""
+        for key in self.keys():
+            remove_output(self.config_dir, key)
+        self.connection.execute('DELETE FROM queue')
+        self.cache = {}
+        self.next_key = 0
+        self.reset_revisions()
+        self.write()
+
+    def clean(self):
+        """Clean queue items from a previous session.
+
+        Running entries of a crashed session are enqueued again.
+        """
+        states = ('paused', 'running', 'stopping', 'killing')
+        query = 'SELECT key FROM queue WHERE status IN (?, ?, ?, ?)'
+        for key in [row[0] for row in self.connection.execute(query, states)]:
+            item = self[key]
+            item['status'] = 'queued'
+            item['start'] = ''
+            item['end'] = ''
+            self.commit(key)
+
+    def clear(self):
+        """Remove all completed tasks from the queue and return their keys."""
+        query = "SELECT key FROM queue WHERE status IN ('done', 'failed')"
+        keys = [row[0] for row in self.connection.execute(query)]
+        self.connection.execute("DELETE FROM queue WHERE status IN ('done', 'failed')")
+        for key in keys:
+            remove_output(self.config_dir, key)
+            self.cache.pop(key, None)
+            self.dirty.add(key)
+            self.record_change(key, True)
+        return keys
+
+    def next(self):
+        """Get the key of the next `queued` entry or `None`."""
+        query = "SELECT key FROM queue WHERE status = 'queued' ORDER BY key LIMIT 1"
+        row = self.connection.execute(query).fetchone()
+        return row[0] if row is not None else None
+
+    def read(self):
+        """Open the database and create the queue table, if it doesn't exist yet.
+
+        If there is no database yet, the queue of the pickle backend is imported.
+        """
+        new_database = not os.path.exists(self.database_path)
+        try:
+            self.connect()
+        except sqlite3.DatabaseError:
+            print('Queue database corrupted, deleting old queue')
+            os.remove(self.database_path)
+            self.connect()
+
+        if new_database and os.path.exists(self.queue_path):
+            generation, queue = read_snapshot(self.queue_path)
+            replay_journal(self.journal_path, generation, queue)
+            for key, entry in queue.items():
+                self[key] = entry
+                self.commit(key)
+        self.connection.commit()
+
+    def connect(self):
+        """Connect to the database and create the schema."""
+        self.connection = sqlite3.connect(self.database_path)
+        # Clients read the database while the daemon writes to it.
+        # With a write-ahead log readers only see committed transactions and never block the daemon.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'key INTEGER PRIMARY KEY, status TEXT NOT NULL, entry BLOB NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS queue_status ON queue (status, key)')
+
+    def write(self):
+        """Commit all pending changes to the database."""
+        try:
+            self.connection.commit()
+        except sqlite3.Error:
+            print('Error while writing to queue database. Wrong file permissions?')
+        self.dirty = set()
+        self.cache = {}
+        self.last_flush = time.time()
+
+    def commit(self, key):
+        """Write the current state of an entry to the database.
+
+        If the entry has been removed from the queue, its row is deleted.
+        The change becomes visible to clients on the next `flush`.
+        """
+        # The entry hasn't been touched since the last flush.
+        if key not in self.cache:
+            return
+
+        entry = self.cache[key]
+        if entry is None:
+            self.connection.execute('DELETE FROM queue WHERE key = ?', (key,))
+        else:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO queue (key, status, entry) VALUES (?, ?, ?)',
+                (key, entry['status'], pickle.dumps(entry, -1))
+            )
+        self.dirty.add(key)
+        self.record_change(key, entry is None)
+
+    def flush(self, force=False):
+        """Commit the transaction with all changes since the last flush."""
+        if self.dirty and (force or time.time() - self.last_flush >= self.flush_interval):
+            self.write()
+        else:
+            # All changes have already been written to the database. The cache isn't needed anymore.
+            self.cache = {}
@@ -13,7 +13,7 @@ setup(
         'terminaltables>=3.1.0',
         'daemonize>=2.4.7',
         'colorclass>=2.2.0',
-        'psutil>=5.2.0',
+        'psutil>=5.3.0',
     ],
     classifiers=[
         'License :: OSI Approved :: MIT License',
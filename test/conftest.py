@@ -1,6 +1,7 @@
 import os
 import time
 import pytest
+import socket
 import subprocess
 
 from test.helper import (
@@ -37,14 +38,25 @@ def daemon_setup(request, directory_setup):
     )
     output, error = process.communicate()
     socket_path = os.path.join(directory_setup[1], 'pueue.sock')
-    while not os.path.exists(socket_path):
-        time.sleep(0.25)
+    # Wait until the daemon accepts connections
+    while True:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(socket_path)
+            break
+        except OSError:
+            time.sleep(0.1)
+        finally:
+            client.close()
 
-    command_factory('reset')()
+    command_factory('reset')({'wait': True})
 
     def daemon_teardown():
-        command_factory('reset')()
+        command_factory('reset')({'wait': True})
         command_factory('STOPDAEMON')()
+        # Wait for the daemon to exit, otherwise the next daemon can't be started.
+        while os.path.exists(socket_path):
+            time.sleep(0.05)
     request.addfinalizer(daemon_teardown)
 
 
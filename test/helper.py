@@ -1,7 +1,7 @@
 import os
-import datetime
-from time import sleep
+import socket
 
+from pueue.client.client import PueueClient
 from pueue.client.factories import command_factory as original_command_factory
 
 
@@ -21,30 +21,21 @@ def execute_add(command):
     command_factory('add')(payload)
 
 
-def wait_for_process(key, timeout=20):
-    start = datetime.datetime.now()
-    threshold = datetime.timedelta(seconds=timeout)
+def get_client():
+    return PueueClient(os.path.join(os.getcwd(), 'temptest'))
 
-    status = command_factory('status')()
-    while (key not in status['data']) or (status['data'][key]['status'] not in ['failed', 'done', 'stashed']):
-        now = datetime.datetime.now()
-        if (now - start) > threshold:
-            raise Exception("Waited for process too long.")
-        sleep(1)
-        status = command_factory('status')()
-    return status
+
+def wait_for_process(key, timeout=20):
+    return wait_for_processes([key], timeout)
 
 
 def wait_for_processes(keys, timeout=30):
-    start = datetime.datetime.now()
-    threshold = datetime.timedelta(seconds=timeout)
-
-    status = command_factory('status')()
-    for key in keys:
-        while (key not in status['data']) or (status['data'][key]['status'] not in ['failed', 'done', 'stashed']):
-            now = datetime.datetime.now()
-            if (now - start) > threshold:
-                raise Exception("Waited for process too long.")
-            sleep(1)
-            status = command_factory('status')()
-    return status
+    # The daemon answers the `wait` instruction once all entries are finished.
+    with get_client() as client:
+        client.socket.settimeout(timeout)
+        try:
+            response = client.wait(keys, ['failed', 'done', 'stashed'])
+        except socket.timeout:
+            raise Exception("Waited for process too long.")
+        assert response['status'] == 'success'
+        return client.status()
@@ -1,3 +1,8 @@
+import io
+
+import pytest
+
+from pueue.client.manipulation import execute_import
 from test.helper import command_factory
 
 
@@ -11,3 +16,32 @@ def test_add(daemon_setup):
     status = command_factory('status')()
     assert status['data'][0]['command'] == 'ls'
     assert status['data'][0]['path'] == '/tmp'
+
+
+def test_add_multiple(daemon_setup):
+    """The daemon adds a list of commands at once."""
+    response = command_factory('add')({
+        'commands': [{'command': 'ls', 'path': '/tmp'}, {'command': 'ls -al', 'path': '/'}],
+    })
+    assert response['status'] == 'success'
+    status = command_factory('status')()
+    assert status['data'][0]['command'] == 'ls'
+    assert status['data'][1]['command'] == 'ls -al'
+    assert status['data'][1]['path'] == '/'
+
+
+def test_import(daemon_setup, directory_setup):
+    """Commands are imported from a file in multiple chunks."""
+    commands = io.StringIO('\n'.join('echo {}'.format(i) for i in range(25)) + '\n\n')
+    execute_import({'file': commands, 'chunk_size': 2}, directory_setup[0])
+    status = command_factory('status')()
+    assert len(status['data']) == 25
+    assert status['data'][24]['command'] == 'echo 24'
+
+
+def test_import_invalid_chunk_size(daemon_setup, directory_setup):
+    """Chunk sizes below 1 are rejected without adding anything."""
+    with pytest.raises(SystemExit):
+        execute_import({'file': io.StringIO('ls\n'), 'chunk_size': 0}, directory_setup[0])
+    status = command_factory('status')()
+    assert status['data'] == 'Queue is empty'
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from pueue.client.client import AsyncPueueClient, QueueMirror
+from test.helper import get_client
+
+
+def test_client_pipelining(daemon_setup):
+    """Pipelined instructions are answered in order over a single connection."""
+    with get_client() as client:
+        client.send('pause')
+        client.send('add', {'command': 'ls', 'path': '/tmp'})
+        client.send('add', {'command': 'ls -al', 'path': '/tmp'})
+        client.send('status')
+        # Responses need to be received before using the convenience methods
+        with pytest.raises(RuntimeError):
+            client.status()
+
+        for _ in range(3):
+            assert client.receive()['status'] == 'success'
+        status = client.receive()
+        assert status['data'][0]['command'] == 'ls'
+        assert status['data'][1]['command'] == 'ls -al'
+
+        assert client.stash([0])['status'] == 'success'
+        assert client.status()['data'][0]['status'] == 'stashed'
+
+
+def test_async_client(daemon_setup, directory_setup):
+    """The asyncio client supports the same instructions."""
+    async def run():
+        async with AsyncPueueClient(directory_setup[0]) as client:
+            await client.pause()
+            assert (await client.add('ls', '/tmp'))['status'] == 'success'
+            return await client.status()
+
+    status = asyncio.run(run())
+    assert status['status'] == 'paused'
+    assert status['data'][0]['command'] == 'ls'
+
+
+def test_incremental_status(daemon_setup):
+    """Only changed and removed entries are sent after the first status."""
+    mirror = QueueMirror()
+    with get_client() as client:
+        client.pause()
+        for command in ['ls', 'ls -al', 'ls -l']:
+            client.add(command, '/tmp')
+        mirror.update(client.status(**mirror.position()))
+        assert sorted(mirror.entries.keys()) == [0, 1, 2]
+
+        client.stash([1])
+        client.remove([2])
+        response = client.status(**mirror.position())
+        assert response['delta']
+        assert list(response['data'].keys()) == [1]
+        assert response['removed'] == [2]
+
+        mirror.update(response)
+        assert sorted(mirror.entries.keys()) == [0, 1]
+        assert mirror.entries[1]['status'] == 'stashed'
+
+        # Without changes nothing is sent
+        response = client.status(**mirror.position())
+        assert response['delta']
+        assert response['data'] == {}
+
+        # After a reset the whole queue is sent again
+        client.reset(wait=True)
+        response = client.status(**mirror.position())
+        assert not response['delta']
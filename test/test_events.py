@@ -0,0 +1,54 @@
+import socket
+import asyncio
+
+from pueue.client.socket import pack_message
+from pueue.daemon.events import MAX_PENDING_BYTES, EventStream
+from test.helper import get_client
+
+
+class DummyLogger():
+    def warning(self, message):
+        pass
+
+
+def test_subscribe(daemon_setup):
+    """Subscribers receive the events of an entry's lifecycle in order."""
+    with get_client() as client, get_client() as subscription:
+        assert subscription.subscribe()['status'] == 'success'
+        events = subscription.events()
+
+        client.pause()
+        assert next(events) == {'event': 'daemon_paused'}
+
+        client.add('exit 3', '/tmp')
+        assert next(events) == {'event': 'added', 'keys': [0]}
+
+        client.start()
+        assert next(events) == {'event': 'daemon_resumed'}
+        assert next(events) == {'event': 'started', 'key': 0}
+        assert next(events) == {'event': 'finished', 'key': 0, 'status': 'failed', 'returncode': 3}
+
+        client.remove([0])
+        assert next(events) == {'event': 'removed', 'keys': [0]}
+
+
+def test_slow_subscriber():
+    """Subscribers that don't read their events are disconnected."""
+    async def publish():
+        disconnected = []
+        stream = EventStream(DummyLogger(), disconnected.append)
+        reader, writer_socket = socket.socketpair()
+        _, writer = await asyncio.open_unix_connection(sock=writer_socket)
+        stream.subscribe(writer)
+
+        message_size = len(pack_message({'event': 'added', 'keys': list(range(1000))}))
+        for _ in range(MAX_PENDING_BYTES // message_size * 2):
+            if disconnected:
+                break
+            stream.publish('added', keys=list(range(1000)))
+
+        assert disconnected == [writer]
+        reader.close()
+        writer.close()
+
+    asyncio.run(publish())
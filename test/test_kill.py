@@ -1,4 +1,5 @@
 import time
+import psutil
 import pytest
 
 from test.helper import (
@@ -118,3 +119,54 @@ def test_kill_shell_of_single_with_multiple_commands(daemon_setup):
     # Assert that the queue entry is finished and failed
     assert status['status'] == 'running'
     assert status['data'][0]['status'] == 'failed'
+
+
+def test_kill_grace(daemon_setup):
+    """Processes terminate gracefully, if they handle `SIGTERM`."""
+    execute_add('sleep 60')
+    time.sleep(1)
+    command_factory('kill')({'keys': [0], 'signal': 'sigint', 'grace': 10})
+    start = time.time()
+    status = wait_for_process(0)
+    assert time.time() - start < 10
+    assert status['data'][0]['status'] == 'failed'
+
+
+@pytest.mark.parametrize('grace', [-1, 0, float('nan'), float('inf'), '10'])
+def test_kill_invalid_grace(daemon_setup, grace):
+    """Invalid grace periods are rejected and the process keeps running."""
+    execute_add('sleep 60')
+    response = command_factory('kill')({'keys': [0], 'signal': 'sigint', 'grace': grace})
+    assert response['status'] == 'error'
+    status = command_factory('status')()
+    assert status['data'][0]['status'] == 'running'
+
+
+def test_kill_grace_escalation(daemon_setup):
+    """Processes, which ignore `SIGTERM`, are killed after the grace period."""
+    execute_add("trap '' TERM; sleep 60")
+    time.sleep(1)
+    command_factory('kill')({'keys': [0], 'signal': 'sigint', 'grace': 1})
+    status = command_factory('status')()
+    assert status['data'][0]['status'] == 'running'
+
+    status = wait_for_process(0)
+    assert status['data'][0]['status'] == 'failed'
+    assert status['data'][0]['returncode'] == -9
+
+
+def test_kill_grandchildren(daemon_setup):
+    """Signals reach all descendants of the shell, not only its direct children."""
+    execute_add("sh -c 'sleep 613 && true' && true")
+    time.sleep(1)
+    command_factory('kill')({'keys': [0], 'signal': 'sigkill'})
+    status = wait_for_process(0)
+    assert status['data'][0]['status'] == 'failed'
+
+    # Give the kernel a moment to clean up the killed processes
+    time.sleep(0.5)
+    sleeping = [
+        process for process in psutil.process_iter(['cmdline'])
+        if process.info['cmdline'] == ['sleep', '613']
+    ]
+    assert sleeping == []
@@ -1,7 +1,15 @@
+import io
+import os
+import pytest
+
 from test.helper import (
     execute_add,
     wait_for_process,
+    command_factory,
 )
+from pueue.client import get_queue
+from pueue.daemon import files
+from pueue.daemon.logger import LOG_OUTPUT_SIZE, Logger
 from pueue.client.displaying import execute_show, execute_log
 
 
@@ -98,3 +106,127 @@ def test_log_multiple_mixed_success(daemon_setup, directory_setup):
     execute_add('ls')
     wait_for_process(1)
     execute_log({'keys': [0, 1, 3]}, directory_setup[0])
+
+
+def test_log_stored_output(daemon_setup, directory_setup, capsys):
+    """The output is stored in a separate file and printed by `log`."""
+    execute_add('echo pueue_output_test')
+    wait_for_process(0)
+    queue = get_queue(directory_setup[1])
+    assert queue[0]['stdout']['size'] == len('pueue_output_test\n')
+
+    execute_log({'keys': [0]}, directory_setup[0])
+    assert 'pueue_output_test' in capsys.readouterr().out
+
+
+def test_log_file_append(daemon_setup, directory_setup):
+    """Finished entries are appended to the log, while `clear` regenerates it."""
+    log_path = os.path.join(directory_setup[0], '.local/share/pueue/queue.log')
+    execute_add('echo first_log_entry')
+    wait_for_process(0)
+    with open(log_path) as log_file:
+        first_log = log_file.read()
+    assert 'first_log_entry' in first_log
+
+    # The removed entry stays in the log, since only the new entry is written.
+    command_factory('remove')({'keys': [0]})
+    execute_add('echo second_log_entry')
+    wait_for_process(1)
+    with open(log_path) as log_file:
+        second_log = log_file.read()
+    assert second_log.startswith(first_log)
+    assert 'first_log_entry' not in second_log[len(first_log):]
+    assert 'second_log_entry' in second_log[len(first_log):]
+
+    # `clear` rotates the log and regenerates it from the remaining entries.
+    execute_add('sleep 60')
+    command_factory('clear')()
+    with open(log_path) as log_file:
+        cleared_log = log_file.read()
+    assert 'first_log_entry' not in cleared_log
+    assert 'second_log_entry' not in cleared_log
+
+
+def test_log_file_spawn_failure(daemon_setup, directory_setup):
+    """Entries, which fail to spawn, are appended to the log."""
+    log_path = os.path.join(directory_setup[0], '.local/share/pueue/queue.log')
+    command_factory('add')({'command': 'echo spawn_failure', 'path': '/nonexistent_pueue_path'})
+    wait_for_process(0)
+    # The entry is logged in the update after it failed, which runs before the next instruction.
+    command_factory('status')()
+    with open(log_path) as log_file:
+        log = log_file.read()
+    assert 'echo spawn_failure' in log
+    assert "The directory for this command doesn't exist anymore" in log
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzma'])
+def test_log_rotated_entry(daemon_setup, directory_setup, capsys, compression):
+    """Entries, which have been cleared from the queue, are read from the rotated log."""
+    command_factory('config')({'option': 'compression', 'value': compression})
+    execute_add('echo rotated_log_entry')
+    wait_for_process(0)
+    command_factory('clear')()
+    # The queue is written in the update after `clear`, which runs before the next instruction.
+    command_factory('status')()
+    capsys.readouterr()
+
+    execute_log({'keys': [0]}, directory_setup[0])
+    output = capsys.readouterr().out
+    assert 'Log of entry 0 from queue-' in output
+    assert 'rotated_log_entry' in output
+    assert 'Command #0' in output
+
+
+def test_log_multiple_rotations(daemon_setup, directory_setup, capsys):
+    """Multiple rotations in a short time don't replace each other's logs."""
+    execute_add('echo first_rotated_entry')
+    wait_for_process(0)
+    command_factory('clear')()
+    execute_add('echo second_rotated_entry')
+    wait_for_process(1)
+    command_factory('clear')()
+    # The queue is written in the update after `clear`, which runs before the next instruction.
+    command_factory('status')()
+    capsys.readouterr()
+
+    execute_log({'keys': [0, 1]}, directory_setup[0])
+    output = capsys.readouterr().out
+    assert 'first_rotated_entry' in output
+    assert 'second_rotated_entry' in output
+
+
+def test_log_file_output_cut(tmpdir):
+    """The current log only contains the beginning of huge outputs."""
+    logger = Logger(str(tmpdir))
+    entry = {'command': 'yes', 'path': '/tmp', 'returncode': 0, 'start': '', 'end': '',
+             'stdout': 'a' * (LOG_OUTPUT_SIZE * 2), 'stderr': ''}
+    logger.append({0: entry}, [0])
+    with open(os.path.join(logger.log_dir, 'queue.log')) as log_file:
+        log = log_file.read()
+    assert 'a' * LOG_OUTPUT_SIZE in log
+    assert 'a' * (LOG_OUTPUT_SIZE + 1) not in log
+    assert 'use `pueue log -k 0` for the whole output' in log
+
+
+def test_descriptor_output(monkeypatch):
+    """Outputs are decoded in chunks and invalid lines are replaced by an error message."""
+    # Chunks end in the middle of multi byte characters and lines
+    monkeypatch.setattr(files, 'OUTPUT_CHUNK_SIZE', 3)
+    output = 'äöü first\nsecond €\n'.encode('utf-8') + b'\xff invalid\n' + 'last ß'.encode('utf-8')
+
+    pieces = list(files.iter_descriptor_output(io.BytesIO(output), 0))
+    assert ''.join(pieces) == 'äöü first\nsecond €\nError while decoding output of process 0\nlast ß'
+    assert files.get_descriptor_output(io.BytesIO(output), 0).count('\n    ') == 3
+
+
+def test_descriptor_output_without_newlines(monkeypatch):
+    """Output without newlines is decoded in bounded pieces, which don't split characters."""
+    monkeypatch.setattr(files, 'OUTPUT_CHUNK_SIZE', 7)
+    monkeypatch.setattr(files, 'MAX_LINE_SIZE', 16)
+    output = ('progress ä€\r' * 1000).encode('utf-8')
+
+    pieces = list(files.iter_descriptor_output(io.BytesIO(output), 0))
+    assert ''.join(pieces) == output.decode('utf-8')
+    assert len(pieces) > 100
+    assert max(len(piece.encode('utf-8')) for piece in pieces) <= 16 + 7
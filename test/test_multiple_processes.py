@@ -1,5 +1,18 @@
+import os
+import time
+import signal
+import subprocess
+
+import pytest
+
+from pueue.daemon.events import EventStream
+from pueue.daemon.logger import Logger
+from pueue.daemon.process_handler import ProcessHandler
+from pueue.daemon.queue import Queue
 from test.helper import (
     command_factory,
+    execute_add,
+    wait_for_processes,
 )
 
 
@@ -20,3 +33,45 @@ def test_multiple_spawned(daemon_setup, multiple_setup):
     assert status['data'][1]['status'] == 'running'
     assert status['data'][2]['status'] == 'running'
     assert status['data'][3]['status'] == 'queued'
+
+
+def test_sequential_processes_without_delay(daemon_setup):
+    """The daemon is woken by exiting processes and starts the next one right away.
+
+    With a polling interval of one second, these entries would take several seconds.
+    """
+    start = time.time()
+    for _ in range(5):
+        execute_add('true')
+    wait_for_processes(list(range(5)))
+    assert time.time() - start < 2.5
+
+
+@pytest.mark.skipif(not hasattr(os, 'waitid'), reason='Requires waitid')
+def test_finished_keys_only_reaps_exited(tmpdir):
+    """Only exited processes are reaped. Exited children, which aren't ours, are reaped and ignored."""
+    root_dir = str(tmpdir)
+    config_dir = os.path.join(root_dir, '.config/pueue')
+    os.makedirs(config_dir)
+    logger = Logger(root_dir)
+    handler = ProcessHandler(Queue(config_dir), logger, config_dir, EventStream(logger, None))
+    handler.set_shell()
+    handler.queue.add_new({'command': 'sleep 60', 'path': '/tmp'})
+    handler.queue.add_new({'command': 'true', 'path': '/tmp'})
+    handler.spawn_new(0)
+    handler.spawn_new(1)
+    foreign = subprocess.Popen(['true'])
+    for pid in [handler.processes[1].pid, foreign.pid]:
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+
+    assert handler.finished_keys() == [1]
+    assert handler.processes[1].returncode == 0
+    assert handler.processes[0].returncode is None
+    # The foreign child has been reaped as well
+    with pytest.raises(ChildProcessError):
+        os.waitpid(foreign.pid, os.WNOHANG)
+    assert handler.finished_keys() == []
+
+    handler.kill_process(0, signal.SIGKILL, True)
+    handler.processes[0].wait()
+    handler.executor.shutdown()
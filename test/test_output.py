@@ -0,0 +1,115 @@
+import os
+import threading
+
+import pytest
+
+from pueue.client import get_queue
+from pueue.daemon import process_handler
+from pueue.daemon.events import EventStream
+from pueue.daemon.files import read_output
+from pueue.daemon.logger import Logger
+from pueue.daemon.process_handler import ProcessHandler
+from pueue.daemon.queue import Queue
+from test.helper import (
+    command_factory,
+    get_client,
+    wait_for_process,
+)
+
+
+def test_max_output(daemon_setup, directory_setup):
+    """Only the head and the tail of huge outputs are stored."""
+    with get_client() as client:
+        client.add("seq 1 200000; seq 1 100000 >&2", '/tmp', max_output=1024)
+    wait_for_process(0)
+
+    queue = get_queue(directory_setup[1])
+    assert queue[0]['status'] == 'done'
+    assert queue[0]['stdout']['size'] < 1100
+    stdout = read_output(queue[0], 'stdout', 0)
+    assert stdout.startswith('1\n    2\n')
+    assert 'bytes truncated ...]' in stdout
+    assert stdout.endswith('199999\n    200000\n    ')
+    assert read_output(queue[0], 'stderr', 0).endswith('100000\n    ')
+
+
+def test_max_output_config(daemon_setup, directory_setup):
+    """The maximum output size can be set for all entries."""
+    command_factory('config')({'option': 'maxOutput', 'value': 100})
+    with get_client() as client:
+        client.add('seq 1 1000', '/tmp')
+        client.add('seq 1 10', '/tmp')
+    wait_for_process(1)
+
+    queue = get_queue(directory_setup[1])
+    assert queue[0]['stdout']['size'] < 150
+    # Small outputs are stored completely
+    assert read_output(queue[1], 'stdout', 1) == '\n    '.join(str(i) for i in range(1, 11)) + '\n    '
+
+
+def test_discard_output(daemon_setup, directory_setup):
+    with get_client() as client:
+        client.add('echo discarded', '/tmp', discard_output=True)
+    wait_for_process(0)
+
+    queue = get_queue(directory_setup[1])
+    assert queue[0]['status'] == 'done'
+    assert read_output(queue[0], 'stdout', 0) == ''
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma', 'none'])
+def test_compressed_output(daemon_setup, directory_setup, compression):
+    """Outputs are stored compressed and decompressed when they're read."""
+    command_factory('config')({'option': 'compression', 'value': compression})
+    with get_client() as client:
+        client.add("yes 'pueue test output' | head -n 100000", '/tmp')
+    wait_for_process(0)
+
+    queue = get_queue(directory_setup[1])
+    stdout = queue[0]['stdout']
+    assert stdout['compression'] == compression
+    assert stdout['size'] == 100000 * len('pueue test output\n')
+    if compression == 'none':
+        assert stdout['stored_size'] == stdout['size']
+    else:
+        assert stdout['stored_size'] < stdout['size'] // 100
+    assert read_output(queue[0], 'stdout', 0) == 'pueue test output\n    ' * 100000
+
+
+def test_background_compression(tmpdir, monkeypatch):
+    """Outputs are stored in the background. Until then, the entry runs and its raw output stays readable."""
+    root_dir = str(tmpdir)
+    config_dir = os.path.join(root_dir, '.config/pueue')
+    os.makedirs(config_dir)
+    logger = Logger(root_dir)
+    handler = ProcessHandler(Queue(config_dir), logger, config_dir, EventStream(logger, None))
+    handler.set_shell()
+
+    # Block the compression until the test releases it
+    release = threading.Event()
+    compress_output = process_handler.compress_output
+
+    def blocked_compress_output(*args):
+        release.wait()
+        return compress_output(*args)
+    monkeypatch.setattr(process_handler, 'compress_output', blocked_compress_output)
+
+    handler.queue.add_new({'command': 'echo background_output', 'path': '/tmp'})
+    handler.spawn_new(0)
+    os.waitid(os.P_PID, handler.processes[0].pid, os.WEXITED | os.WNOWAIT)
+    handler.check_finished()
+    assert handler.queue[0]['status'] == 'running'
+    assert not handler.all_finished()
+    with open(os.path.join(config_dir, 'pueue_process_0.stdout')) as raw_output:
+        assert raw_output.read() == 'background_output\n'
+
+    release.set()
+    handler.storing[0][0].result()
+    handler.check_finished()
+    assert handler.queue[0]['status'] == 'done'
+    assert handler.all_finished()
+    assert not os.path.exists(os.path.join(config_dir, 'pueue_process_0.stdout'))
+    assert read_output(handler.queue[0], 'stdout', 0) == 'background_output\n    '
+    with open(os.path.join(logger.log_dir, 'queue.log')) as log_file:
+        assert 'background_output' in log_file.read()
+    handler.executor.shutdown()
@@ -0,0 +1,48 @@
+import os
+
+from pueue.client.socket import (
+    connect_socket,
+    pack_message,
+    receive_data,
+    send_data,
+)
+from test.helper import command_factory, wait_for_process
+
+
+def test_large_message(daemon_setup):
+    """Messages bigger than the socket buffer are received completely."""
+    command = 'echo ' + 'a' * 4 * 1048576
+    command_factory('add')({'command': command, 'path': '/tmp'})
+    status = command_factory('status')()
+    assert status['data'][0]['command'] == command
+
+
+def test_multiple_requests_per_connection(daemon_setup):
+    """The connection stays open and multiple instructions can be sent at once."""
+    client = connect_socket(os.path.join(os.getcwd(), 'temptest'))
+    # Send two messages in a single packet
+    client.sendall(
+        pack_message({'mode': 'add', 'command': 'ls', 'path': '/tmp'}) +
+        pack_message({'mode': 'add', 'command': 'ls -al', 'path': '/tmp'})
+    )
+    assert receive_data(client)['status'] == 'success'
+    assert receive_data(client)['status'] == 'success'
+
+    send_data(client, {'mode': 'status'})
+    status = receive_data(client)
+    client.close()
+    assert status['data'][0]['command'] == 'ls'
+    assert status['data'][1]['command'] == 'ls -al'
+
+
+def test_broken_instruction(daemon_setup):
+    """A broken instruction is answered with an error and the daemon keeps working."""
+    client = connect_socket(os.path.join(os.getcwd(), 'temptest'))
+    # The `keys` of the stash instruction are missing
+    send_data(client, {'mode': 'stash'})
+    assert receive_data(client)['status'] == 'error'
+
+    send_data(client, {'mode': 'add', 'command': 'ls', 'path': '/tmp'})
+    assert receive_data(client)['status'] == 'success'
+    client.close()
+    wait_for_process(0)
@@ -0,0 +1,166 @@
+import os
+import pickle
+
+from pueue.client import get_queue
+from pueue.daemon.queue import Queue
+from pueue.daemon.sqlite_queue import SqliteQueue, read_database
+from test.helper import execute_add, wait_for_process
+
+
+def test_journal_replay(tmpdir):
+    """Changes are replayed from the journal after a restart."""
+    config_dir = str(tmpdir)
+    queue = Queue(config_dir)
+    queue.add_new({'command': 'ls', 'path': '/tmp'})
+    queue.add_new({'command': 'ls -al', 'path': '/tmp'})
+    queue[0]['status'] = 'done'
+    queue.commit(0)
+    queue.remove(1)
+    queue.flush()
+
+    queue = Queue(config_dir)
+    assert list(queue.keys()) == [0]
+    assert queue[0]['status'] == 'done'
+    assert queue.next_key == 1
+
+
+def test_journal_crash_recovery(tmpdir):
+    """Running entries are queued again and a truncated record is ignored."""
+    config_dir = str(tmpdir)
+    queue = Queue(config_dir)
+    queue.add_new({'command': 'ls', 'path': '/tmp'})
+    queue[0]['status'] = 'running'
+    queue.commit(0)
+    queue.flush()
+
+    # Simulate a crash while appending a record
+    with open(os.path.join(config_dir, 'queue.journal'), 'ab') as journal:
+        journal.write(pickle.dumps((1, {'command': 'ls'}), -1)[:10])
+
+    queue = Queue(config_dir)
+    assert list(queue.keys()) == [0]
+    assert queue[0]['status'] == 'queued'
+
+
+def test_get_queue(daemon_setup, directory_setup):
+    """The client sees changes, which are only stored in the journal."""
+    execute_add('ls')
+    wait_for_process(0)
+    queue = get_queue(directory_setup[1])
+    assert queue[0]['status'] == 'done'
+
+
+def test_flush_coalesces_changes(tmpdir):
+    """Changes are only written on flush and multiple changes of an entry result in one record."""
+    config_dir = str(tmpdir)
+    queue = Queue(config_dir)
+    journal_size = os.path.getsize(queue.journal_path)
+    queue.add_new({'command': 'ls', 'path': '/tmp'})
+    for status in ['running', 'paused', 'done']:
+        queue[0]['status'] = status
+        queue.commit(0)
+    assert os.path.getsize(queue.journal_path) == journal_size
+
+    queue.flush()
+    with open(queue.journal_path, 'rb') as journal:
+        records = journal.read()[journal_size:]
+    assert records.count(b'/tmp') == 1
+    assert Queue(config_dir)[0]['status'] == 'done'
+
+
+def test_sqlite_queue(tmpdir):
+    """The SQLite backend behaves like the default queue and persists its changes."""
+    config_dir = str(tmpdir)
+    queue = SqliteQueue(config_dir)
+    for command in ['ls', 'ls -al', 'ls -l']:
+        queue.add_new({'command': command, 'path': '/tmp'})
+    queue[0]['status'] = 'done'
+    queue.commit(0)
+    assert queue.next() == 1
+    assert queue.switch(1, 2)
+    assert queue.restart(0)
+    queue.flush()
+
+    queue = SqliteQueue(config_dir)
+    assert queue.keys() == [0, 1, 2, 3]
+    assert queue[1]['command'] == 'ls -l'
+    assert queue[3]['command'] == 'ls'
+
+    queue.clear()
+    queue.flush()
+    assert queue.keys() == [1, 2, 3]
+    assert sorted(read_database(queue.database_path).keys()) == [1, 2, 3]
+
+
+def test_sqlite_queue_import(tmpdir):
+    """The queue of the pickle backend is imported into a new database."""
+    config_dir = str(tmpdir)
+    queue = Queue(config_dir)
+    queue.add_new({'command': 'ls', 'path': '/tmp'})
+    queue.flush()
+
+    queue = SqliteQueue(config_dir)
+    assert queue[0]['command'] == 'ls'
+    assert queue.next_key == 1
+
+
+def test_next_follows_status_changes(tmpdir):
+    """`next` returns the smallest queued key after stash, enqueue, switch and restart."""
+    queue = Queue(str(tmpdir))
+    for command in ['ls', 'ls -al', 'ls -l']:
+        queue.add_new({'command': command, 'path': '/tmp'})
+    assert queue.next() == 0
+
+    queue[0]['status'] = 'stashed'
+    queue.commit(0)
+    assert queue.next() == 1
+
+    assert queue.switch(0, 2)
+    assert queue.next() == 0
+
+    queue[0]['status'] = 'done'
+    queue.commit(0)
+    queue[1]['status'] = 'running'
+    queue.commit(1)
+    assert queue.next() is None
+
+    queue[2]['status'] = 'queued'
+    queue.commit(2)
+    assert queue.next() == 2
+    assert queue.restart(0)
+    assert queue.next() == 2
+    queue.remove(2)
+    assert queue.next() == 3
+
+
+def test_changes_since(tmpdir):
+    """Changed and removed keys are tracked by revision."""
+    queue = Queue(str(tmpdir))
+    for command in ['ls', 'ls -al', 'ls -l']:
+        queue.add_new({'command': command, 'path': '/tmp'})
+    revision = queue.revision
+    assert queue.changes_since(revision) == ([], [])
+
+    queue[0]['status'] = 'done'
+    queue.commit(0)
+    queue.remove(1)
+    assert queue.changes_since(revision) == ([0], [1])
+    assert queue.changes_since(revision + 1) == ([], [1])
+    assert queue.changes_since(revision + 3) is None
+
+    queue.reset()
+    assert queue.changes_since(revision) is None
+    assert queue.changes_since(queue.revision) == ([], [])
+
+
+def test_select(tmpdir):
+    """Both backends select entries by status and key range."""
+    for queue in [Queue(str(tmpdir)), SqliteQueue(str(tmpdir.mkdir('sqlite')))]:
+        for command in ['ls', 'ls -al', 'ls -l', 'echo']:
+            queue.add_new({'command': command, 'path': '/tmp'})
+        queue[2]['status'] = 'done'
+        queue.commit(2)
+
+        assert [key for key, _ in queue.select()] == [0, 1, 2, 3]
+        assert [key for key, _ in queue.select(['queued'], 1)] == [1, 3]
+        assert [key for key, _ in queue.select(['done', 'queued'], 1, 2)] == [1, 2]
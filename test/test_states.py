@@ -1,6 +1,7 @@
 from test.helper import (
     execute_add,
     command_factory,
+    get_client,
 )
 
 
@@ -17,7 +18,7 @@ def test_reset_paused(daemon_setup):
     command_factory('pause')()
     execute_add('sleep 60')
     execute_add('sleep 60')
-    command_factory('reset')()
+    command_factory('reset')({'wait': True})
     status = command_factory('status')()
     assert status['status'] == 'paused'
     assert status['data'] == 'Queue is empty'
@@ -28,7 +29,19 @@ def test_reset_running(daemon_setup):
     command_factory('start')()
     execute_add('sleep 60')
     execute_add('sleep 60')
-    command_factory('reset')()
+    command_factory('reset')({'wait': True})
     status = command_factory('status')()
     assert status['status'] == 'running'
     assert status['data'] == 'Queue is empty'
+
+
+def test_reset_wait_pipelined(daemon_setup):
+    """Instructions after a waiting reset are executed once the reset finished."""
+    command_factory('config')({'option': 'maxProcesses', 'value': 2})
+    execute_add('sleep 60')
+    execute_add('sleep 60')
+    with get_client() as client:
+        client.send('reset', {'wait': True})
+        client.send('status')
+        assert client.receive()['message'] == 'Queue has been reset'
+        assert client.receive()['data'] == 'Queue is empty'
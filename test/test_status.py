@@ -0,0 +1,52 @@
+from test.helper import command_factory
+
+
+def add_entries():
+    command_factory('pause')()
+    for command, path in [('ls', '/tmp'), ('ls -al', '/tmp/a'), ('echo', '/'), ('ls -l', '/tmp')]:
+        command_factory('add')({'command': command, 'path': path})
+    command_factory('stash')({'keys': [1, 3]})
+
+
+def test_status_filter(daemon_setup):
+    """The daemon only sends entries matching the filters."""
+    add_entries()
+    status = command_factory('status')({'statuses': ['stashed']})
+    assert sorted(status['data'].keys()) == [1, 3]
+
+    status = command_factory('status')({'path': '/tmp', 'command': 'ls'})
+    assert sorted(status['data'].keys()) == [0, 1, 3]
+
+    status = command_factory('status')({'min_key': 1, 'max_key': 2, 'statuses': ['queued']})
+    assert sorted(status['data'].keys()) == [2]
+
+    status = command_factory('status')({'command': 'rm'})
+    assert status['data'] == {}
+
+
+def test_status_pagination(daemon_setup):
+    """Entries are paginated in the order of their keys."""
+    add_entries()
+    status = command_factory('status')({'limit': 2})
+    assert sorted(status['data'].keys()) == [0, 1]
+    assert status['more']
+
+    status = command_factory('status')({'limit': 2, 'offset': 2})
+    assert sorted(status['data'].keys()) == [2, 3]
+    assert not status['more']
+
+
+def test_status_negative_pagination(daemon_setup):
+    """Negative pagination values are rejected and the daemon keeps running."""
+    add_entries()
+    assert command_factory('status')({'limit': -1})['status'] == 'error'
+    assert command_factory('status')({'offset': -1})['status'] == 'error'
+    status = command_factory('status')({'limit': 2})
+    assert sorted(status['data'].keys()) == [0, 1]
+
+
+def test_status_fields(daemon_setup):
+    """Only the requested fields are sent."""
+    add_entries()
+    status = command_factory('status')({'fields': ['status']})
+    assert status['data'][0] == {'status': 'queued'}
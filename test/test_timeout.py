@@ -0,0 +1,39 @@
+import time
+
+from test.helper import (
+    command_factory,
+    get_client,
+    wait_for_process,
+)
+
+
+def test_timeout(daemon_setup):
+    """Processes, which exceed their timeout, are killed and marked as timed out."""
+    with get_client() as client:
+        client.add('sleep 60', '/tmp', timeout=1)
+        client.add('sleep 0.1', '/tmp', timeout=10)
+    start = time.time()
+    status = wait_for_process(0)
+    assert time.time() - start < 10
+    assert status['data'][0]['status'] == 'failed'
+    assert status['data'][0]['timed_out']
+
+    status = wait_for_process(1)
+    assert status['data'][1]['status'] == 'done'
+    assert not status['data'][1]['timed_out']
+
+
+def test_timeout_signal(daemon_setup):
+    """The timeout signal is configurable and processes are killed, if they ignore it."""
+    command_factory('config')({'option': 'timeoutSignal', 'value': 'sigint'})
+    with get_client() as client:
+        client.add('sleep 60', '/tmp', timeout=0.5)
+    status = wait_for_process(0)
+    assert status['data'][0]['timed_out']
+    assert status['data'][0]['returncode'] == -2
+
+
+def test_invalid_timeout(daemon_setup):
+    with get_client() as client:
+        assert client.add('ls', '/tmp', timeout=-1)['status'] == 'error'
+        assert client.config('timeoutSignal', 'nosignal')['status'] == 'error'
@@ -0,0 +1,82 @@
+import time
+
+from test.helper import (
+    command_factory,
+    execute_add,
+    get_client,
+)
+
+
+def test_wait(daemon_setup):
+    """Wait until an entry is finished."""
+    execute_add('sleep 1')
+    with get_client() as client:
+        response = client.wait([0])
+        assert response['status'] == 'success'
+        assert response['failed'] == []
+        assert client.status()['data'][0]['status'] == 'done'
+
+
+def test_wait_finished(daemon_setup):
+    """The daemon answers right away, if the entries are already finished."""
+    execute_add('ls')
+    with get_client() as client:
+        client.wait([0])
+        response = client.wait([0])
+        assert response['status'] == 'success'
+
+
+def test_wait_all_stashed(daemon_setup):
+    """Stashed entries don't block waiting for all entries."""
+    command_factory('pause')()
+    execute_add('ls')
+    execute_add('ls')
+    command_factory('stash')({'keys': [0]})
+    command_factory('start')()
+    with get_client() as client:
+        client.socket.settimeout(10)
+        response = client.wait()
+        assert response['status'] == 'success'
+        data = client.status()['data']
+        assert [data[key]['status'] for key in range(2)] == ['stashed', 'done']
+
+
+def test_wait_all(daemon_setup):
+    """Without keys all entries are awaited and failed entries are reported."""
+    command_factory('config')({'option': 'maxProcesses', 'value': 2})
+    execute_add('sleep 1 && exit 1')
+    execute_add('sleep 0.5')
+    execute_add('ls')
+    with get_client() as client:
+        response = client.wait()
+        assert response['status'] == 'success'
+        assert response['failed'] == [0]
+        data = client.status()['data']
+        assert [data[key]['status'] for key in range(3)] == ['failed', 'done', 'done']
+
+
+def test_wait_status(daemon_setup):
+    """Wait for another status than `done` or `failed`."""
+    execute_add('sleep 60')
+    with get_client() as client:
+        response = client.wait([0], ['running'])
+        assert response['status'] == 'success'
+        assert client.status()['data'][0]['status'] == 'running'
+        client.kill([0], 'sigkill', True)
+
+
+def test_wait_removed(daemon_setup):
+    """Removed entries don't block waiting clients."""
+    command_factory('pause')({'wait': False})
+    execute_add('ls')
+    with get_client() as client, get_client() as waiting:
+        waiting.send('wait', {'keys': [0]})
+        # Give the daemon time to register the waiting client
+        time.sleep(0.5)
+        client.remove([0])
+        assert waiting.receive()['status'] == 'success'
+
+
+def test_wait_unknown_key(daemon_setup):
+    with get_client() as client:
+        assert client.wait([5])['status'] == 'error'
@@ -0,0 +1,48 @@
+#!/bin/env python3
+# Measure how long it takes to kill all running tasks with `pueue kill` and `pueue kill --all`.
+# A temporary daemon is started for this. Usage: kill_benchmark.py [tasks]
+import sys
+import time
+import shutil
+import tempfile
+
+from status_benchmark import start_daemon
+
+
+def measure(client, tasks, kill_shell):
+    """Start `tasks` processes and return the time it takes to send and process `kill`."""
+    client.pause()
+    client.config('maxProcesses', tasks)
+    # The `&&` makes the shell spawn a child process, as with most real commands.
+    commands = [{'command': 'sleep 600 && true', 'path': '/tmp'} for _ in range(tasks)]
+    client.request('add', {'commands': commands})
+    client.start()
+    client.wait(statuses=['running'])
+
+    start = time.perf_counter()
+    client.kill(signal='sigkill', all=kill_shell)
+    killed = time.perf_counter()
+    client.wait()
+    finished = time.perf_counter()
+    return killed - start, finished - start
+
+
+def main():
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    root_dir = tempfile.mkdtemp()
+    client = start_daemon(root_dir)
+    try:
+        print('tasks  mode             kill request  all processes finished')
+        for kill_shell in [False, True]:
+            sent, finished = measure(client, tasks, kill_shell)
+            mode = 'kill --all' if kill_shell else 'kill (children)'
+            print('{:5}  {:15}  {:9.2f} ms  {:19.2f} ms'.format(tasks, mode, sent * 1000, finished * 1000))
+            client.reset(wait=True)
+    finally:
+        client.request('STOPDAEMON')
+        client.close()
+        shutil.rmtree(root_dir)
+
+
+if __name__ == '__main__':
+    main()
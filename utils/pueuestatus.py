@@ -3,14 +3,13 @@
 # Intended for use with i3pystatus.
 import os
 import sys
-from pueue.client.factories import command_factory
+from pueue.client.client import PueueClient
 
 
 def main():
     try:
-        status = command_factory('status')(
-            {}, root_dir=os.path.expanduser('~')
-        )
+        with PueueClient(os.path.expanduser('~')) as client:
+            status = client.status()
         if type(status['data']) == str:
             print(status['data'])
         else:
@@ -23,6 +22,9 @@ def main():
                 entry_status = status['data'][key]['status']
                 status_list.append(("{}: {}".format(key, entry_status)))
             print(', '.join(status_list))
+    except OSError:
+        print('Daemon not running')
+        sys.exit(1)
     except KeyboardInterrupt:
         sys.exit(0)
 
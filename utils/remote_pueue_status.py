@@ -2,16 +2,16 @@
 import os
 import sys
 import subprocess
-from pueue.daemon.queue import Queue
-from pueue.client.factories import command_factory
+from pueue.client import get_queue
 
 
 def main():
     try:
-        subprocess.run("rsync root@jarvis:~/.config/pueue/queue /tmp", shell=True, check=True)
-        queue = Queue('/tmp')
-        queue.read()
-        data = queue.queue
+        subprocess.run("rsync root@jarvis:.config/pueue/queue root@jarvis:.config/pueue/queue.journal /tmp",
+                       shell=True, check=True)
+        data = get_queue('/tmp')
+        if data is None:
+            sys.exit(1)
         if len(data) == 0:
             print('Queue is empty')
         else:
@@ -0,0 +1,60 @@
+#!/bin/env python3
+# Measure the latency of `pueue status` depending on the size of the queue.
+# A temporary daemon is started for this. Usage: status_benchmark.py [sizes...]
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from pueue.client.client import PueueClient
+
+REPETITIONS = 20
+
+
+def start_daemon(root_dir):
+    """Start a daemon with the pueue package, that is used by this script."""
+    subprocess.run(
+        [sys.executable, '-c', 'from pueue import main; main()', '--daemon', '--root', root_dir],
+        check=True,
+    )
+    while True:
+        try:
+            return PueueClient(root_dir)
+        except OSError:
+            time.sleep(0.1)
+
+
+def measure(client, size):
+    """Fill the queue up to `size` entries and return the median latency of a status request."""
+    client.pause()
+    data = client.status()['data']
+    existing = len(data) if isinstance(data, dict) else 0
+    commands = [{'command': 'echo {}'.format(i), 'path': '/tmp'} for i in range(existing, size)]
+    for start in range(0, len(commands), 10000):
+        client.request('add', {'commands': commands[start:start + 10000]})
+
+    timings = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        client.status()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 50000]
+    root_dir = tempfile.mkdtemp()
+    client = start_daemon(root_dir)
+    try:
+        print('entries  median status latency')
+        for size in sorted(sizes):
+            print('{:7}  {:8.2f} ms'.format(size, measure(client, size) * 1000))
+    finally:
+        client.request('STOPDAEMON')
+        client.close()
+        shutil.rmtree(root_dir)
+
+
+if __name__ == '__main__':
+    main()